@@ -0,0 +1,233 @@
+# allocation.py
+# Budget allocation engine shared by the API and the dataset rebalancer.
+#
+# Shares are fractions of income, one row per person and one column per
+# category. `apply_savings_target` and `project` push every row onto the
+# floors / caps / sum-to-income constraint set in one vectorized pass,
+# following the rules that used to live only in rebalance_dataset.rebalance_row:
+#   0. force Savings into the target band (15–20%), respecting the age cap
+#   1. raise to floors, then clip to caps
+#   2. over income: trim FLEX first, then CRITICAL down towards their floors
+#      under income: top up the top-up group (ESSENTIALS)
+#   3. re-apply caps, spilling the excess into the top-up group
+#   4. normalize away any remaining drift
+#
+# The API sends partial category lists, where topping up whichever essentials
+# happen to be present would pile the leftover onto them. `allocate` only tops
+# up when every essential is present; otherwise the leftover goes to Savings
+# (up to its cap) and whatever remains is reported as unallocated, as it is
+# when the caps alone can't add up to income. Each canonical category's rules
+# apply to the first name that matches it only.
+import numpy as np
+
+CANONICAL = [
+    "Food","Transport","Housing","Utilities",
+    "Entertainment","Savings","Healthcare","Education","Emergency"
+]
+
+ESSENTIALS = ["Food","Housing","Healthcare","Utilities","Transport"]
+CRITICAL   = {"Food","Transport","Housing","Utilities","Healthcare","Education","Emergency"}
+FLEX       = {"Entertainment","Savings"}  # trimmed first
+
+SAVINGS_TARGET = 0.17
+SAVINGS_MIN    = 0.15
+SAVINGS_MAX    = 0.20
+
+def age_band(age):
+    a = int(round(float(age)))
+    if a <= 30: return "young"
+    if a <= 55: return "mid"
+    return "old"
+
+def floors_caps(age):
+    band = age_band(age)
+
+    # Floors (as % of income) – light but realistic
+    edu_floor = 0.03 if int(float(age)) <= 30 else 0.00
+    health_floor = 0.04 if band=="young" else (0.06 if band=="mid" else 0.08)
+
+    FLOORS = {
+        "Food":        0.18,    # >= 18%
+        "Transport":   0.06,    # >= 6%
+        "Utilities":   0.05,    # >= 5%
+        "Healthcare":  health_floor,
+        "Education":   edu_floor,
+        "Emergency":   0.03     # >= 3%
+    }
+
+    # Caps (as % of income)
+    SAV_CAP = 0.25 if band=="young" else 0.20
+    CAPS = {
+        "Savings":       SAV_CAP,
+        "Entertainment": 0.12,
+        "Housing":       0.35,
+    }
+    return FLOORS, CAPS
+
+def canonical_category(name):
+    """Map a free-form category name onto CANONICAL (None when nothing matches)."""
+    norm = str(name).lower().strip()
+    if not norm:
+        return None
+    for cat in CANONICAL:
+        key = cat.lower()
+        if key in norm or norm in key:
+            return cat
+    return None
+
+def category_limits(ages, columns):
+    """Floors and caps for each age (rows) and canonical column name (cols).
+
+    Columns that are not canonical (None) get no floor and no cap.
+    Returns two float arrays of shape (len(ages), len(columns)).
+    """
+    ages = np.asarray(ages, dtype=float).reshape(-1)
+    uniq, inverse = np.unique(ages, return_inverse=True)
+    floors = np.zeros((len(uniq), len(columns)))
+    caps = np.full((len(uniq), len(columns)), np.inf)
+    for i, age in enumerate(uniq):
+        FLOORS, CAPS = floors_caps(age)
+        for j, col in enumerate(columns):
+            floors[i, j] = FLOORS.get(col, 0.0)
+            caps[i, j] = CAPS.get(col, np.inf)
+    return floors[inverse], caps[inverse]
+
+def canonical_columns(names):
+    """canonical_category for each name; later names matching the same category get None."""
+    seen, out = set(), []
+    for name in names:
+        cat = canonical_category(name)
+        if cat in seen:
+            cat = None
+        elif cat is not None:
+            seen.add(cat)
+        out.append(cat)
+    return out
+
+def category_masks(columns):
+    """FLEX / top-up / CRITICAL masks for a list of canonical names (or None)."""
+    flex = np.array([c in FLEX for c in columns], dtype=bool)
+    topup = np.array([c in ESSENTIALS for c in columns], dtype=bool)
+    critical = np.array([c in CRITICAL for c in columns], dtype=bool)
+    return flex, topup, critical
+
+def _add_to(pr, mask, amount):
+    """Add `amount` (per row) to the masked columns, pro rata or evenly if empty."""
+    pool = (pr * mask).sum(axis=1)
+    even = amount / max(1, int(mask.sum()))
+    prop = np.divide(amount, pool, out=np.zeros_like(pool), where=pool > 0)
+    add = np.where((pool > 0)[:, None], pr * prop[:, None], even[:, None]) * mask
+    return pr + np.where((amount > 0)[:, None], add, 0.0)
+
+def apply_savings_target(pr, caps, col, target=SAVINGS_TARGET,
+                         min_target=SAVINGS_MIN, max_target=SAVINGS_MAX):
+    """Force column `col` (Savings) to the target clamped to the band and the age cap.
+
+    target may be a scalar or one value per row (e.g. a model prediction).
+    Modifies pr in place and returns it.
+    """
+    target = np.clip(np.asarray(target, dtype=float), min_target, max_target)
+    pr[:, col] = np.minimum(target, np.broadcast_to(caps, pr.shape)[:, col])
+    return pr
+
+def project(shares, floors, caps, flex, topup, critical, savings=None):
+    """Project allocation shares onto the floors/caps/sum-to-one constraint set.
+
+    shares, floors and caps are (n, k) arrays (or broadcastable to it); flex,
+    topup and critical are boolean column masks of length k (an empty top-up
+    group sends leftover income to Savings instead), and savings is the
+    Savings column index (or None). Returns (shares, unallocated): an
+    (n, k) array and the per-row share of income left unallocated, which is
+    only non-zero when the rules can't add up to income.
+    """
+    pr = np.atleast_2d(np.asarray(shares, dtype=float)).copy()
+    floors = np.broadcast_to(floors, pr.shape)
+    caps = np.broadcast_to(caps, pr.shape)
+
+    # Floors, then caps
+    pr = np.minimum(np.maximum(pr, floors), caps)
+
+    s = pr.sum(axis=1)
+    over = s > 1.0
+
+    # Over income: trim FLEX pro rata
+    pool = (pr * flex).sum(axis=1)
+    trim = over & (pool > 0)
+    ratio = np.divide(s - 1.0, pool, out=np.zeros_like(pool), where=pool > 0)
+    trimmed = np.maximum(0.0, pr - pr * ratio[:, None])
+    pr = np.where(trim[:, None] & flex, trimmed, pr)
+
+    # Still over: take from CRITICAL above their floors
+    s2 = pr.sum(axis=1)
+    still = over & (s2 > 1.0)
+    free = np.maximum(0.0, pr - floors) * critical
+    free_pool = free.sum(axis=1)
+    take = np.divide(s2 - 1.0, free_pool, out=np.zeros_like(free_pool), where=free_pool > 0)
+    lowered = np.maximum(floors, pr - free * take[:, None])
+    pr = np.where((still & (free_pool > 0))[:, None] & critical, lowered, pr)
+
+    if not np.any(topup):
+        # Nothing to top up: leftover goes to Savings, the rest stays unallocated
+        left = np.maximum(0.0, 1.0 - pr.sum(axis=1))
+        if savings is not None:
+            room = np.maximum(0.0, caps[:, savings] - pr[:, savings])
+            add = np.minimum(room, left)
+            pr[:, savings] += add
+            left = left - add
+        return pr, left
+
+    # Under income: top up
+    pr = _add_to(pr, topup, np.where(s < 1.0, 1.0 - s, 0.0))
+
+    # Re-check caps: non-top-up columns spill first, then top-up columns
+    for group in (~topup, topup):
+        excess = np.maximum(0.0, pr - caps) * group
+        pr = pr - excess
+        pr = _add_to(pr, topup, excess.sum(axis=1))
+
+    # Caps that can't add up to income: keep them and report the gap
+    feasible = caps.sum(axis=1) >= 1.0
+    capped = np.minimum(pr, caps)
+    left = np.where(feasible, 0.0, np.maximum(0.0, 1.0 - capped.sum(axis=1)))
+
+    # Final normalize (tiny drift)
+    total = pr.sum(axis=1, keepdims=True)
+    pr = np.divide(pr, total, out=pr.copy(), where=total > 0)
+    return np.where(feasible[:, None], pr, capped), left
+
+def allocate(ages, incomes, drafts, savings_targets=None):
+    """Apply the rules to per-person draft allocations ({category: rupees}).
+
+    Categories are matched to CANONICAL by name; unknown ones (and repeats of
+    an already matched category) get no floor or cap and are trimmed with
+    FLEX. Leftover income only tops up essentials when all of ESSENTIALS are
+    in the list. savings_targets gives each person's Savings
+    share (None uses SAVINGS_TARGET). Drafts sharing a category list go
+    through one project call. Returns a list of (allocation, unallocated rupees).
+    """
+    if savings_targets is None:
+        savings_targets = [None] * len(drafts)
+    groups = {}
+    for i, draft in enumerate(drafts):
+        groups.setdefault(tuple(draft.keys()), []).append(i)
+
+    out = [None] * len(drafts)
+    for names, idx in groups.items():
+        canon = canonical_columns(names)
+        floors, caps = category_limits([ages[i] for i in idx], canon)
+        flex, topup, critical = category_masks(canon)
+        flex |= np.array([c is None for c in canon], dtype=bool)
+        if not set(ESSENTIALS) <= set(canon):
+            topup[:] = False
+        shares = np.array([[drafts[i][c] / incomes[i] for c in names] for i in idx])
+
+        sav = canon.index("Savings") if "Savings" in canon else None
+        if sav is not None:
+            targets = [SAVINGS_TARGET if savings_targets[i] is None else savings_targets[i] for i in idx]
+            apply_savings_target(shares, caps, sav, targets)
+
+        shares, left = project(shares, floors, caps, flex, topup, critical, savings=sav)
+        for row, i in enumerate(idx):
+            allocation = {c: round(float(p) * incomes[i], 2) for c, p in zip(names, shares[row])}
+            out[i] = (allocation, round(float(left[row]) * incomes[i], 2))
+    return out
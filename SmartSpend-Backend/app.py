@@ -6,9 +6,18 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 import numpy as np
 import pandas as pd
+import hmac
 import re
 import warnings
 
+from allocation import allocate
+from feature_store import FeatureStore, model_features
+import conversation_store
+import fast_json
+import peer_percentiles
+from recommend_jobs import JobQueue, webhook_allowed
+import request_profiler
+
 # Suppress sklearn warnings
 warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
 
@@ -22,6 +31,12 @@ genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
 app = Flask(__name__)
 
+# orjson-backed jsonify plus gzip/brotli for large responses
+fast_json.init_app(app)
+
+# Opt-in request profiling (no hooks registered unless configured)
+request_profiler.from_env().init_app(app)
+
 # ML model
 try:
     PACK = joblib.load("budget_model.pkl")
@@ -33,6 +48,20 @@ except Exception as e:
     MODEL = None
     FEATURES = ["Age", "Income"]
 
+# Peer spending percentiles (one process per host rebuilds, the rest reload; 0 disables)
+PEER_REFRESH_SECONDS = int(os.getenv("PEER_PERCENTILES_REFRESH_SECONDS", "3600"))
+if PEER_REFRESH_SECONDS > 0:
+    peer_percentiles.start_refresh_thread(supabase, PEER_REFRESH_SECONDS)
+
+# Per-user features, kept current by Supabase database webhooks. Without a
+# webhook secret, entries are re-backfilled once older than FEATURE_STORE_MAX_AGE_SECONDS.
+FEATURE_STORE = FeatureStore()
+FEATURE_STORE_WEBHOOK_SECRET = os.getenv("FEATURE_STORE_WEBHOOK_SECRET")
+FEATURE_STORE_MAX_AGE = None if FEATURE_STORE_WEBHOOK_SECRET else int(os.getenv("FEATURE_STORE_MAX_AGE_SECONDS", "60"))
+
+# Chatbot conversation memory (CONVERSATION_STORE=memory|sqlite)
+CONVERSATIONS = conversation_store.from_env()
+
 
 def _num(v, default=0.0):
     try:
@@ -41,6 +70,15 @@ def _num(v, default=0.0):
         return float(default)
 
 
+def _model_input(rows):
+    """DataFrame with the model's FEATURES columns (every row must have all of them)."""
+    return pd.DataFrame([{f: _num(r[f]) for f in FEATURES} for r in rows], columns=FEATURES)
+
+
+def _has_features(row):
+    return all(row.get(f) is not None for f in FEATURES)
+
+
 # ---------- Clean response ----------
 def clean_response(text: str) -> str:
     if not text:
@@ -115,64 +153,87 @@ def is_off_topic(msg: str) -> bool:
 
 
 # ---------- Budget recommendation logic ----------
-def generate_budget_recommendation(age, income, categories, weights=None):
-    """Generate budget recommendation using ML model and rules"""
-    
-    print(f"🎯 Generating recommendation for Age: {age}, Income: {income}")
-    print(f"📊 Categories: {categories}")
-    print(f"⚖️ Weights: {weights}")
-    
-    # Default category allocations (as percentages of income)
-    default_allocations = {
-        'food': 0.25,
-        'transport': 0.15, 
-        'housing': 0.20,
-        'utilities': 0.08,
-        'healthcare': 0.05,
-        'education': 0.05,
-        'entertainment': 0.08,
-        'savings': 0.10,
-        'emergency': 0.04
-    }
-    
-    # Normalize category names for matching
-    def normalize_name(name):
-        return name.lower().strip()
-    
-    # Create recommendation dictionary
+# Default category allocations (as percentages of income)
+DEFAULT_ALLOCATIONS = {
+    'food': 0.25,
+    'transport': 0.15, 
+    'housing': 0.20,
+    'utilities': 0.08,
+    'healthcare': 0.05,
+    'education': 0.05,
+    'entertainment': 0.08,
+    'savings': 0.10,
+    'emergency': 0.04
+}
+
+
+def _normalize_name(name):
+    return name.lower().strip()
+
+
+def _recommend_features(items, ages, incomes):
+    """Model inputs per item; items with a user_id get profile features from the
+    feature store, loaded (and backfilled) for the whole batch at once."""
+    rows = [{"Age": age, "Income": income} for age, income in zip(ages, incomes)]
+    need = [i for i, row in enumerate(rows) if items[i].get("user_id") and not _has_features(row)]
+    if not need:
+        return rows
+    try:
+        profiles = FEATURE_STORE.load_users(
+            supabase, [items[i]["user_id"] for i in need], FEATURE_STORE_MAX_AGE)
+    except Exception as e:
+        print(f"⚠️ Failed to load user features for recommendation: {e}")
+        profiles = {}
+    for i in need:
+        features = profiles.get(str(items[i]["user_id"]))
+        if features:
+            rows[i] = {**model_features(features["profile"]), **rows[i]}
+    return rows
+
+
+def _predict_savings(rows):
+    """ML savings prediction for many feature rows in one predict call.
+
+    Rows missing any of the model's FEATURES get None instead of a guess.
+    """
+    out = [None] * len(rows)
+    if MODEL is None:
+        return out
+    complete = [i for i, r in enumerate(rows) if _has_features(r)]
+    if len(complete) < len(rows):
+        print(f"⚠️ {len(rows) - len(complete)} rows lack model features {FEATURES}; no ML savings for them")
+    if not complete:
+        return out
+    try:
+        input_data = _model_input([rows[i] for i in complete])
+        preds = np.asarray(MODEL.predict(input_data), dtype=float)
+        if preds.ndim == 2 and preds.shape[1] == 1:
+            preds = preds[:, 0]
+        if preds.ndim != 1:
+            raise ValueError(f"expected one savings value per row, got shape {preds.shape}")
+        for i, p in zip(complete, preds):
+            out[i] = max(0, float(p))
+    except Exception as e:
+        print(f"⚠️ ML prediction failed: {e}")
+    return out
+
+
+def _draft_recommendation(income, categories, weights, ml_savings_amount):
+    """Initial allocation from defaults, spending weights and the ML savings figure."""
     recommendation = {}
-    allocated_percentage = 0
-    
-    # Try ML model prediction for savings if available
-    ml_savings_amount = None
-    if MODEL is not None:
-        try:
-            # Create input with proper feature names
-            if len(FEATURES) >= 2:
-                input_data = pd.DataFrame({
-                    FEATURES[0]: [age],
-                    FEATURES[1]: [income]
-                })
-            else:
-                input_data = np.array([[age, income]])
-            
-            ml_prediction = MODEL.predict(input_data)[0]
-            ml_savings_amount = max(0, float(ml_prediction))
-            print(f"🤖 ML predicted savings: Rs. {ml_savings_amount}")
-        except Exception as e:
-            print(f"⚠️ ML prediction failed: {e}")
-            ml_savings_amount = None
-    
+    used_defaults = set()
+
     # Allocate based on categories provided
     for category in categories:
-        norm_cat = normalize_name(category)
+        norm_cat = _normalize_name(category)
         
-        # Find matching default allocation
+        # Find matching default allocation (each default share is handed out once)
         allocated_amount = 0
-        for default_key, default_pct in default_allocations.items():
+        for default_key, default_pct in DEFAULT_ALLOCATIONS.items():
             if default_key in norm_cat or norm_cat in default_key:
-                allocated_amount = income * default_pct
-                allocated_percentage += default_pct
+                if default_key not in used_defaults:
+                    used_defaults.add(default_key)
+                    allocated_amount = income * default_pct
                 break
         
         # If no match found, allocate based on weights or default small amount
@@ -184,45 +245,134 @@ def generate_budget_recommendation(age, income, categories, weights=None):
                 allocated_amount = min(income * 0.15, income * weight_pct * 2)  # Cap at 15%
             else:
                 allocated_amount = income * 0.03  # 3% default
-            
-            allocated_percentage += allocated_amount / income
         
         recommendation[category] = round(allocated_amount, 2)
     
     # Handle savings specially if ML model provided a prediction
-    savings_categories = [cat for cat in categories if 'saving' in normalize_name(cat)]
+    savings_categories = [cat for cat in categories if 'saving' in _normalize_name(cat)]
     if savings_categories and ml_savings_amount is not None:
-        savings_cat = savings_categories[0]
-        old_savings = recommendation.get(savings_cat, 0)
-        recommendation[savings_cat] = round(ml_savings_amount, 2)
-        
-        # Adjust allocated percentage
-        allocated_percentage += (ml_savings_amount - old_savings) / income
+        recommendation[savings_categories[0]] = round(ml_savings_amount, 2)
+
+    return recommendation
+
+
+def generate_budget_recommendations(items):
+    """Batch recommendations; each item is a dict with age, income, categories, weights
+    and an optional user_id (used for model features beyond Age/Income).
+
+    Drafts are projected onto the floors/caps/sum-to-income rules the training
+    data uses. Returns one (recommendation, unallocated) pair per item.
+    """
+    ages = [_num(r.get("age", 25)) for r in items]
+    incomes = [_num(r.get("income", 0)) for r in items]
+    ml_savings = _predict_savings(_recommend_features(items, ages, incomes))
+    drafts = [
+        _draft_recommendation(income, r.get("categories") or [], r.get("weights") or {}, sav)
+        for r, income, sav in zip(items, incomes, ml_savings)
+    ]
+    savings_targets = [None if sav is None else sav / income for sav, income in zip(ml_savings, incomes)]
+    return allocate(ages, incomes, drafts, savings_targets)
+
+
+def generate_budget_recommendation(age, income, categories, weights=None, user_id=None):
+    """Generate budget recommendation using ML model and rules"""
+    
+    print(f"🎯 Generating recommendation for Age: {age}, Income: {income}")
+    print(f"📊 Categories: {categories}")
+    print(f"⚖️ Weights: {weights}")
     
-    # Ensure we don't exceed income
-    total_allocated = sum(recommendation.values())
-    if total_allocated > income:
-        # Scale down proportionally
-        scale_factor = income / total_allocated
-        for cat in recommendation:
-            recommendation[cat] = round(recommendation[cat] * scale_factor, 2)
-        total_allocated = sum(recommendation.values())
+    recommendation, unallocated = generate_budget_recommendations([{
+        "age": age, "income": income, "categories": categories, "weights": weights,
+        "user_id": user_id,
+    }])[0]
     
-    # Distribute remaining amount if any
-    remaining = income - total_allocated
-    if remaining > 1:  # More than Rs. 1 remaining
-        # Add to savings if exists, otherwise distribute evenly
-        savings_cats = [cat for cat in categories if 'saving' in normalize_name(cat)]
-        if savings_cats:
-            recommendation[savings_cats[0]] += round(remaining, 2)
+    print(f"✅ Generated recommendation: {recommendation} (unallocated {unallocated})")
+    return recommendation, unallocated
+
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def validate_recommend_item(item):
+    """Error message for a malformed recommendation request (None when it's usable)."""
+    if not isinstance(item, dict):
+        return "Item must be an object"
+    if _num(item.get("income", 0)) <= 0:
+        return "Income must be greater than 0"
+    categories = item.get("categories")
+    if not categories:
+        return "Categories list cannot be empty"
+    if not isinstance(categories, list) or not all(isinstance(c, str) and c.strip() for c in categories):
+        return "Categories must be a list of non-empty strings"
+    user_id = item.get("user_id")
+    if user_id is not None and not isinstance(user_id, str):
+        return "user_id must be a string"
+    weights = item.get("weights")
+    if weights and (not isinstance(weights, dict) or not all(_is_number(v) for v in weights.values())):
+        return "Weights must map category names to numbers"
+    return None
+
+
+def recommend_batch(items):
+    """Validate and recommend a chunk of job items, one result dict per item.
+
+    Items that fail validation, or fail inside the batch, get an error result
+    without affecting the rest of the chunk.
+    """
+    results = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        error = validate_recommend_item(item)
+        if error:
+            results[i] = {"error": error}
         else:
-            # Distribute evenly
-            per_category = remaining / len(categories)
-            for cat in recommendation:
-                recommendation[cat] += round(per_category, 2)
-    
-    print(f"✅ Generated recommendation: {recommendation}")
-    return recommendation
+            valid.append(i)
+
+    try:
+        recommendations = generate_budget_recommendations([items[i] for i in valid])
+    except Exception as e:
+        # Retry one by one so only the failing items get an error
+        print(f"⚠️ Batch recommendation failed ({e}); retrying items one at a time")
+        recommendations = []
+        for i in valid:
+            try:
+                recommendations.append(generate_budget_recommendations([items[i]])[0])
+            except Exception as item_error:
+                recommendations.append(item_error)
+
+    for i, outcome in zip(valid, recommendations):
+        if isinstance(outcome, Exception):
+            results[i] = {"error": f"Failed to generate recommendation: {outcome}"}
+            continue
+        recommendation, unallocated = outcome
+        results[i] = {
+            "recommendation": recommendation,
+            "total_allocated": sum(recommendation.values()),
+            "unallocated": unallocated,
+            "income": _num(items[i].get("income", 0)),
+            "model_used": MODEL is not None,
+        }
+    return results
+
+
+# Bulk recommendation jobs, run by worker threads in each web process (0 = enqueue
+# only, for a separate worker on the same disk; see recommend_jobs.py). Callers
+# need RECOMMEND_JOB_API_KEY; without it the job endpoints are off.
+JOB_QUEUE = JobQueue(recommend_batch, chunk_size=int(os.getenv("RECOMMEND_JOB_CHUNK_SIZE", "500")))
+JOB_QUEUE.start_workers(int(os.getenv("RECOMMEND_JOB_WORKERS", "1")))
+RECOMMEND_JOB_MAX_ITEMS = int(os.getenv("RECOMMEND_JOB_MAX_ITEMS", "100000"))
+RECOMMEND_JOB_API_KEY = os.getenv("RECOMMEND_JOB_API_KEY")
+
+
+def _job_caller_error():
+    """Error response unless the request carries RECOMMEND_JOB_API_KEY (None when it does)."""
+    if not RECOMMEND_JOB_API_KEY:
+        return jsonify({"error": "Recommendation jobs are not configured"}), 404
+    key = request.headers.get("X-Api-Key", "")
+    if not hmac.compare_digest(key.encode(), RECOMMEND_JOB_API_KEY.encode()):
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
 
 
 # ---------- Health check endpoint ----------
@@ -253,22 +403,22 @@ def recommend_budget():
         income = _num(data.get("income", 0))
         categories = data.get("categories", [])
         weights = data.get("weights", {})
+        user_id = data.get("user_id")
         
         print(f"📥 Recommendation request: age={age}, income={income}, categories={len(categories)}")
         
         # Validate input
-        if income <= 0:
-            return jsonify({"error": "Income must be greater than 0"}), 400
-        
-        if not categories:
-            return jsonify({"error": "Categories list cannot be empty"}), 400
+        error = validate_recommend_item(data)
+        if error:
+            return jsonify({"error": error}), 400
         
         # Generate recommendation
-        recommendation = generate_budget_recommendation(age, income, categories, weights)
+        recommendation, unallocated = generate_budget_recommendation(age, income, categories, weights, user_id)
         
         return jsonify({
             "recommendation": recommendation,
             "total_allocated": sum(recommendation.values()),
+            "unallocated": unallocated,
             "income": income,
             "model_used": MODEL is not None
         })
@@ -278,69 +428,234 @@ def recommend_budget():
         return jsonify({"error": f"Failed to generate recommendation: {str(e)}"}), 500
 
 
-# ---------- Chatbot endpoint ----------
-@app.route("/chatbot", methods=["POST"])
-def chatbot():
+# ---------- Bulk recommendation jobs ----------
+@app.route('/api/recommend/jobs', methods=['POST'])
+def submit_recommend_job():
+    error = _job_caller_error()
+    if error:
+        return error
+    data = request.get_json(force=True)
+    items = data.get("items")
+    webhook_url = data.get("webhook_url")
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items must be a non-empty list"}), 400
+    if len(items) > RECOMMEND_JOB_MAX_ITEMS:
+        return jsonify({"error": f"At most {RECOMMEND_JOB_MAX_ITEMS} items per job"}), 400
+    if webhook_url and not webhook_allowed(webhook_url):
+        return jsonify({"error": "webhook_url must be an https URL on an allowed host"}), 400
+
+    job_id = JOB_QUEUE.submit(items, webhook_url)
+    print(f"📥 Recommendation job {job_id} queued with {len(items)} items")
+    return jsonify({
+        "job_id": job_id,
+        "status_url": f"/api/recommend/jobs/{job_id}",
+        "results_url": f"/api/recommend/jobs/{job_id}/results",
+    }), 202
+
+
+@app.route('/api/recommend/jobs/<job_id>', methods=['GET'])
+def recommend_job_status(job_id):
+    error = _job_caller_error()
+    if error:
+        return error
+    job = JOB_QUEUE.status(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@app.route('/api/recommend/jobs/<job_id>/results', methods=['GET'])
+def recommend_job_results(job_id):
+    error = _job_caller_error()
+    if error:
+        return error
+    job = JOB_QUEUE.status(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    offset = max(0, request.args.get("offset", 0, type=int))
+    limit = min(5000, max(1, request.args.get("limit", 1000, type=int)))
+    return jsonify({
+        "job_id": job_id,
+        "status": job["status"],
+        "offset": offset,
+        "results": JOB_QUEUE.results(job_id, offset, limit),
+    })
+
+
+# ---------- Peer percentile endpoint ----------
+@app.route('/api/peer-percentiles', methods=['POST'])
+def peer_percentile_lookup():
     data = request.get_json(force=True)
     user_id = data.get("user_id")
-    user_msg = (data.get("message") or "").strip()
+    spends = data.get("spends")
+    age = data.get("age")
+    income = data.get("income")
 
-    if not user_id:
-        return jsonify({"message": "⚠️ No user ID provided."})
+    if not peer_percentiles.PEERS.ready:
+        return jsonify({"error": "Peer percentiles are not available yet"}), 503
 
-    if is_invalid_message(user_msg):
-        return jsonify({
-            "message": (
-                "❌ I am unable to respond to this type of message.\n\n"
-                "👉 Please ask a question related to **finance**, such as:\n"
-                "- Savings\n"
-                "- Investment advice\n"
-                "- Financial planning"
-            )
-        })
+    if user_id and (age is None or income is None or not spends):
+        try:
+            features = FEATURE_STORE.load_user(supabase, user_id, FEATURE_STORE_MAX_AGE)
+        except Exception as e:
+            print(f"❌ Failed to load user features for peer percentiles: {e}")
+            return jsonify({"error": "Failed to fetch user data"}), 500
+        if features is None:
+            return jsonify({"error": "User not found"}), 404
+
+        if age is None or income is None:
+            age = features["profile"].get("age")
+            income = features["profile"].get("monthly_income")
+            if age is None or income is None:
+                # No age/income on the profile: don't guess a band
+                return jsonify({"error": "age and income are not set for this user; pass them explicitly"}), 400
+        if not spends:
+            # Same window the peer sketches are built over (store totals are lifetime)
+            try:
+                spends = peer_percentiles.fetch_user_window_spend(supabase, user_id)
+            except Exception as e:
+                print(f"❌ Failed to fetch spend for peer percentiles: {e}")
+                return jsonify({"error": "Failed to fetch user data"}), 500
+
+    if age is None or income is None or not spends:
+        return jsonify({"error": "age, income and spends (or user_id) are required"}), 400
+
+    spends = {str(k): _num(v) for k, v in spends.items()}
+    band, percentiles = peer_percentiles.PEERS.lookup(_num(age), _num(income), spends)
+    return jsonify({
+        "band": band,
+        "percentiles": percentiles,
+        "window_days": peer_percentiles.WINDOW_DAYS,
+        "built_at": peer_percentiles.PEERS.built_at,
+    })
 
-    if is_off_topic(user_msg):
-        return jsonify({
-            "message": (
-                "❌ Sorry, I can only help with **finance-related questions**.\n\n"
-                "👉 Try asking about:\n"
-                "- Savings target\n"
-                "- Investments\n"
-                "- Spending cuts\n"
-                "- Budgeting"
-            )
-        })
 
+# ---------- Feature store webhook ----------
+@app.route('/hooks/feature-store', methods=['POST'])
+def feature_store_webhook():
+    # Supabase database webhook: {"type", "table", "record", "old_record"}
+    if not FEATURE_STORE_WEBHOOK_SECRET:
+        return jsonify({"error": "Feature store webhook is not configured"}), 404
+    secret = request.headers.get("X-Webhook-Secret", "")
+    if not hmac.compare_digest(secret.encode(), FEATURE_STORE_WEBHOOK_SECRET.encode()):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    payload = request.get_json(force=True)
+    try:
+        applied = FEATURE_STORE.apply_change(
+            payload.get("table"), payload.get("type"),
+            payload.get("record"), payload.get("old_record"))
+    except Exception as e:
+        print(f"❌ Feature store update failed: {e}")
+        return jsonify({"error": "Failed to apply change"}), 500
+    return jsonify({"applied": applied})
+
+
+# ---------- Chatbot conversation memory ----------
+def _conversation_key(data):
+    """Store key for the client's conversation_id (None: no memory for this request)."""
+    if not data.get("user_id") or not data.get("conversation_id"):
+        return None
+    return f"{data.get('user_id')}:{data.get('conversation_id')}"
+
+
+def _request_user_id():
+    """Supabase user id for the request's bearer token (None when missing or invalid)."""
+    auth = request.headers.get("Authorization", "")
+    if not auth.startswith("Bearer "):
+        return None
+    try:
+        resp = supabase.auth.get_user(auth[len("Bearer "):])
+        return resp.user.id if resp and resp.user else None
+    except Exception as e:
+        print(f"⚠️ Failed to verify access token: {e}")
+        return None
+
+
+def _remember(key, conversation, user_msg, reply, prompt):
+    """Store the turn and report this turn's prompt size."""
+    prompt_chars = len(prompt)
+    conversation_store.add_turn(conversation, user_msg, reply, prompt_chars)
+    if key is not None:
+        try:
+            CONVERSATIONS.save(key, conversation)
+        except Exception as e:
+            print(f"⚠️ Failed to save conversation: {e}")
+    print(f"💬 Turn {conversation['turn_count']} ({key or 'no memory'}): prompt {prompt_chars} chars, "
+          f"summary {len(conversation['summary'])} chars")
+    return {
+        "turn": conversation["turn_count"],
+        "prompt_chars": prompt_chars,
+        "summary_chars": len(conversation["summary"]),
+    }
+
+
+def _owned_conversation_key(data):
+    """Conversation key for an authenticated owner, or an error response."""
+    key = _conversation_key(data)
+    if key is None:
+        return None, (jsonify({"error": "user_id and conversation_id are required"}), 400)
+    if _request_user_id() != data.get("user_id"):
+        return None, (jsonify({"error": "Unauthorized"}), 401)
+    return key, None
+
+
+@app.route("/chatbot/conversation", methods=["GET"])
+def chatbot_conversation():
+    key, error = _owned_conversation_key(request.args)
+    if error:
+        return error
+    conversation = CONVERSATIONS.get(key)
+    return jsonify({
+        "turns": conversation["turn_count"],
+        "summary": conversation["summary"],
+        "recent": conversation["turns"],
+        "prompt_chars": conversation["prompt_chars"],
+    })
+
+
+@app.route("/chatbot/reset", methods=["POST"])
+def chatbot_reset():
+    key, error = _owned_conversation_key(request.get_json(force=True))
+    if error:
+        return error
+    CONVERSATIONS.clear(key)
+    return jsonify({"reset": True})
+
+
+# ---------- Chatbot grounding ----------
+def _load_grounding(user_id):
+    """The user's financial summary for the prompt, plus the raw rows it was built from."""
     # -------------------------
-    # 1. Fetch user profile
+    # 1. User features (one keyed lookup, backfilled from raw rows on a miss or when stale)
     # -------------------------
     try:
-        user_row = supabase.table("users").select(
-            "id, age, monthly_income").eq("id", user_id).execute()
-        age = _num(user_row.data[0].get("age", 0)) if user_row.data else 0
-        main_income = _num(user_row.data[0].get("monthly_income", 0)) if user_row.data else 0
+        features = FEATURE_STORE.load_user(supabase, user_id, FEATURE_STORE_MAX_AGE)
     except Exception as e:
-        print(f"❌ Failed to fetch user profile: {e}")
-        age, main_income = 0, 0
+        print(f"❌ Failed to load user features: {e}")
+        features = None
+    features = features or {"profile": {}, "income": [], "spend": []}
+    profile = features["profile"]
+    age = _num(profile.get("age", 0))
+    main_income = _num(profile.get("monthly_income", 0))
 
     # -------------------------
     # 2. Fetch other tables
     # -------------------------
     try:
-        income_records = supabase.table("income").select("*").eq("user_id", user_id).execute().data or []
-        expense_records = supabase.table("expenses").select("*").eq("user_id", user_id).execute().data or []
         accounts = supabase.table("accounts").select("*").eq("user_id", user_id).execute().data or []
         transactions = supabase.table("transactions").select("*").eq("user_id", user_id).execute().data or []
         sms_records = supabase.table("sms_records").select("*").eq("user_id", user_id).execute().data or []
         categories = supabase.table("categories").select("*").eq("user_id", user_id).execute().data or []
     except Exception as e:
         print(f"❌ Failed to fetch user data: {e}")
-        income_records = expense_records = accounts = transactions = sms_records = categories = []
+        accounts = transactions = sms_records = categories = []
 
-    category_lookup = {cat["id"]: cat.get("name", "Other") for cat in categories}
+    category_lookup = {str(cat["id"]): cat.get("name", "Other") for cat in categories}
 
     income_breakdown = {"main_income": main_income, "extras": [], "total": main_income}
-    for inc in income_records:
+    for inc in features["income"]:
         if inc.get("source") == "BaseMonthly":
             continue
         amt = _num(inc.get("amount", 0))
@@ -348,10 +663,9 @@ def chatbot():
         income_breakdown["total"] += amt
 
     expense_breakdown = {"items": [], "total": 0.0}
-    for exp in expense_records:
+    for exp in features["spend"]:
         amt = _num(exp.get("amount", 0))
-        cat_id = exp.get("category_id")
-        cat_name = category_lookup.get(cat_id, exp.get("name", "Other"))
+        cat_name = category_lookup.get(exp.get("category_id"), exp.get("name") or "Other")
         expense_breakdown["items"].append({"name": cat_name, "amount": amt})
         expense_breakdown["total"] += amt
 
@@ -369,28 +683,20 @@ def chatbot():
             if diff < best_diff:
                 best_row, best_diff = row, diff
         benchmark = best_row or {}
-        typical_rate = _num(benchmark.get("savings_rate", 7))
     except Exception as e:
         print(f"❌ Failed to fetch benchmarks: {e}")
         benchmark = {}
-        typical_rate = 7
 
-    # ML prediction
-    # ML prediction (safe wrapper)
-        # -------------------------
+    # -------------------------
     # ML prediction (safe wrapper)
     # -------------------------
     try:
         pred_savings = None
-        if MODEL is not None:
-            # Ensure input is always a 2D array or DataFrame
-            if len(FEATURES) >= 2:
-                input_data = pd.DataFrame({
-                    FEATURES[0]: [age],
-                    FEATURES[1]: [total_income]
-                })
-            else:
-                input_data = np.array([[age, total_income]])
+        model_row = {**model_features(profile), "Income": total_income}
+        if MODEL is not None and not _has_features(model_row):
+            print(f"⚠️ Profile lacks model features {FEATURES}; no ML savings suggestion")
+        elif MODEL is not None:
+            input_data = _model_input([model_row])
 
             raw_pred = MODEL.predict(input_data)
             if isinstance(raw_pred, (list, np.ndarray)) and len(raw_pred) > 0:
@@ -401,16 +707,86 @@ def chatbot():
         print(f"❌ ML prediction failed in chatbot: {e}")
         pred_savings = None
 
+    grounding = {
+        "age": age,
+        "income": income_breakdown,
+        "expenses": expense_breakdown,
+        "savings": savings,
+        "savings_rate": savings_rate,
+        "benchmark": benchmark,
+        "model_suggestion": pred_savings,
+        "has_data": bool(
+            total_income > 0 or total_expenses > 0 or accounts or transactions or sms_records or categories
+        ),
+    }
+    raw = {
+        "accounts": accounts,
+        "transactions": transactions,
+        "sms_records": sms_records,
+        "categories": categories,
+    }
+    return grounding, raw
 
 
-    user_has_data = (
-        total_income > 0 or total_expenses > 0 or accounts or transactions or sms_records or categories
-    )
+# ---------- Chatbot endpoint ----------
+@app.route("/chatbot", methods=["POST"])
+def chatbot():
+    data = request.get_json(force=True)
+    user_id = data.get("user_id")
+    user_msg = (data.get("message") or "").strip()
+
+    if not user_id:
+        return jsonify({"message": "⚠️ No user ID provided."})
+
+    # Memory is per client-supplied conversation_id; without one each message stands alone
+    conversation_key = _conversation_key(data)
+    conversation = conversation_store.empty_state()
+    if conversation_key is not None:
+        try:
+            conversation = CONVERSATIONS.get(conversation_key)
+        except Exception as e:
+            print(f"⚠️ Failed to load conversation: {e}")
+    history = conversation_store.history_prompt(conversation)
+
+    if is_invalid_message(user_msg):
+        return jsonify({
+            "message": (
+                "❌ I am unable to respond to this type of message.\n\n"
+                "👉 Please ask a question related to **finance**, such as:\n"
+                "- Savings\n"
+                "- Investment advice\n"
+                "- Financial planning"
+            )
+        })
+
+    # Short follow-ups ("why?", "and next month?") are fine once a conversation has started
+    if is_off_topic(user_msg) and not (conversation["turn_count"] > 0 and conversation_store.is_follow_up(user_msg)):
+        return jsonify({
+            "message": (
+                "❌ Sorry, I can only help with **finance-related questions**.\n\n"
+                "👉 Try asking about:\n"
+                "- Savings target\n"
+                "- Investments\n"
+                "- Spending cuts\n"
+                "- Budgeting"
+            )
+        })
+
+    # Grounding is fetched once per conversation and reused until it expires
+    grounding = conversation_store.cached_grounding(conversation)
+    if grounding is None:
+        grounding, raw = _load_grounding(user_id)
+        conversation_store.set_grounding(conversation, grounding)
+        grounding_used = {**grounding, **raw}
+    else:
+        grounding_used = {**grounding, "cached_at": conversation["grounding_at"]}
 
-    if not user_has_data:
+    if not grounding["has_data"]:
         fallback_prompt = f"""
         You are SmartSpend's Finance Assistant 🤖💰.
 
+        {history}
+
         The user asked: "{user_msg}"
         
         Please provide helpful financial advice and tips since they haven't set up their financial data yet.
@@ -419,7 +795,12 @@ def chatbot():
         try:
             model = genai.GenerativeModel("gemini-1.5-flash")
             resp = model.generate_content([fallback_prompt])
-            return jsonify({"message": clean_response(resp.text), "grounding_used": {"benchmark": benchmark}})
+            reply = clean_response(resp.text)
+            return jsonify({
+                "message": reply,
+                "grounding_used": {"benchmark": grounding["benchmark"]},
+                "conversation": _remember(conversation_key, conversation, user_msg, reply, fallback_prompt),
+            })
         except Exception as e:
             if "429" in str(e) or "quota" in str(e).lower():
                 return jsonify({
@@ -428,23 +809,16 @@ def chatbot():
                 }), 429
             return jsonify({"message": "⚠️ Something went wrong while processing your request."}), 500
 
-    grounding = {
-        "age": age,
-        "income": income_breakdown,
-        "expenses": expense_breakdown,
-        "accounts": accounts,
-        "transactions": transactions,
-        "sms_records": sms_records,
-        "categories": categories,
-        "savings": savings,
-        "savings_rate": savings_rate,
-        "benchmark": benchmark,
-        "model_suggestion": pred_savings,
-    }
+    age = grounding["age"]
+    total_income = grounding["income"]["total"]
+    total_expenses = grounding["expenses"]["total"]
+    savings = grounding["savings"]
+    savings_rate = grounding["savings_rate"]
+    expense_items = grounding["expenses"]["items"]
 
     exp_list = "\n".join(
-        [f"- {item['name']}: Rs. {item['amount']}" for item in expense_breakdown["items"]]
-    ) if expense_breakdown["items"] else "No detailed expense items available."
+        [f"- {item['name']}: Rs. {item['amount']}" for item in expense_items]
+    ) if expense_items else "No detailed expense items available."
 
     prompt = f"""
     You are SmartSpend's friendly Finance Assistant 🤖💰.
@@ -459,6 +833,8 @@ def chatbot():
     Recent Expenses:
     {exp_list}
 
+    {history}
+
     The user has asked: "{user_msg}"
 
     Please provide personalized financial advice based on their actual data.
@@ -468,7 +844,12 @@ def chatbot():
     try:
         model = genai.GenerativeModel("gemini-1.5-flash")
         resp = model.generate_content([prompt])
-        return jsonify({"message": clean_response(resp.text), "grounding_used": grounding})
+        reply = clean_response(resp.text)
+        return jsonify({
+            "message": reply,
+            "grounding_used": grounding_used,
+            "conversation": _remember(conversation_key, conversation, user_msg, reply, prompt),
+        })
     except Exception as e:
         if "429" in str(e) or "quota" in str(e).lower():
             return jsonify({
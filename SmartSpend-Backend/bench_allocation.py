@@ -0,0 +1,222 @@
+# bench_allocation.py
+# Benchmark: vectorized allocation engine vs the original per-row rebalancer.
+#
+#   python bench_allocation.py --rows 100000
+#   python bench_allocation.py --input real_training_data.csv
+#
+# Also reports the largest rupee difference between the two, so the batch
+# path can be checked against the row-by-row reference.
+import argparse
+import csv
+import random
+import time
+from math import isfinite
+
+import numpy as np
+
+from rebalance_dataset import COLUMNS, rebalance_rows
+from allocation import (
+    CRITICAL, ESSENTIALS, FLEX, apply_savings_target, category_limits,
+    category_masks, floors_caps, project,
+)
+
+
+# ---------- Reference: original iterative row code ----------
+def pct(x, income):
+    if income <= 0: return 0.0
+    try:
+        v = float(x)
+        if not isfinite(v): return 0.0
+        return max(0.0, v / income)
+    except:
+        return 0.0
+
+def rupees(p, income):
+    return round(max(0.0, p) * income, 2)
+
+def iterative_rebalance_row(row, target_sav=0.17, min_target=0.15, max_target=0.20):
+    changed = False
+
+    age    = float(row["Age"])
+    income = float(row["Income"])
+    if income <= 0:
+        return row, changed  # nothing to do
+
+    cats = {k: float(row[k]) for k in COLUMNS if k not in ("Age","Income")}
+    # coerce bad values to 0
+    for k in list(cats.keys()):
+        v = cats[k]
+        cats[k] = v if isfinite(v) and v>=0 else 0.0
+
+    FLOORS, CAPS = floors_caps(age)
+
+    # Convert to pct of income
+    pr = {k: pct(cats[k], income) for k in cats}
+    s = sum(pr.values())
+    if s > 0:
+        for k in pr: pr[k] = pr[k] / s  # light normalization
+
+    pr, changed = iterative_shares(pr, age, target_sav, min_target, max_target)
+
+    # Back to rupees
+    for k in cats:
+        cats[k] = rupees(pr.get(k, 0.0), income)
+
+    out = {**row}
+    for k in cats:
+        # keep 2dp strings like your file
+        new_val = f"{cats[k]:.2f}"
+        if new_val != row[k]:
+            changed = True
+        out[k] = new_val
+    return out, changed
+
+def iterative_shares(pr, age, target_sav=0.17, min_target=0.15, max_target=0.20):
+    """The per-row rule math on already-parsed, normalized shares."""
+    changed = False
+    FLOORS, CAPS = floors_caps(age)
+
+    # --- NEW: Force Savings into target band (default 17%, clamped 15–20%) ---
+    forced_target = max(min_target, min(max_target, float(target_sav)))
+    before_sav = pr.get("Savings", 0.0)
+    pr["Savings"] = min(forced_target, CAPS["Savings"])  # respect age-based cap
+    if abs(pr["Savings"] - before_sav) > 1e-9:
+        changed = True
+    # -----------------------------------------------------------------------
+
+    # Apply floors for critical
+    for k, fl in FLOORS.items():
+        if pr.get(k, 0.0) < fl:
+            pr[k] = fl
+            changed = True
+
+    # Apply caps
+    for k, cap in CAPS.items():
+        if pr.get(k, 0.0) > cap:
+            pr[k] = cap
+            changed = True
+
+    # Balance to 1.0 (trim FLEX first, then top-up CRITICAL)
+    def total():
+        return sum(pr.values())
+
+    def trim_from(groups, amount):
+        if amount <= 0: return
+        pool = sum(pr.get(g,0) for g in groups)
+        if pool <= 0: return
+        for g in groups:
+            share = pr.get(g,0)/pool if pool>0 else 0
+            pr[g] = max(0.0, pr.get(g,0) - amount*share)
+
+    def add_to(groups, amount):
+        if amount <= 0: return
+        pool = sum(pr.get(g,0) for g in groups)
+        if pool <= 0:
+            # even split
+            each = amount / max(1, len(groups))
+            for g in groups:
+                pr[g] = pr.get(g,0) + each
+            return
+        for g in groups:
+            share = pr.get(g,0)/pool
+            pr[g] = pr.get(g,0) + amount*share
+
+    s = total()
+    if s > 1.0:
+        trim_from(FLEX, s-1.0)
+        s = total()
+        if s > 1.0:
+            # trim critical above floors
+            over = s-1.0
+            free_pool = sum(max(0.0, pr[c]-FLOORS.get(c,0.0)) for c in CRITICAL)
+            if free_pool > 0:
+                for c in CRITICAL:
+                    free = max(0.0, pr[c]-FLOORS.get(c,0.0))
+                    take = over * (free/free_pool)
+                    pr[c] = max(FLOORS.get(c,0.0), pr[c]-take)
+    elif s < 1.0:
+        # Top-up essentials first
+        add_to(ESSENTIALS, 1.0 - s)
+
+    # Re-check caps after top-up
+    for k, cap in CAPS.items():
+        if pr.get(k,0.0) > cap:
+            spill = pr[k] - cap
+            pr[k] = cap
+            add_to(ESSENTIALS, spill)
+
+    # Final normalize (tiny drift)
+    s = total()
+    if s > 0:
+        for k in pr: pr[k] /= s
+    return pr, changed
+
+
+
+# ---------- Benchmark ----------
+def synthetic_rows(n, seed=42):
+    rnd = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        income = rnd.randint(20000, 400000)
+        row = {"Age": str(rnd.randint(18, 70)), "Income": str(income)}
+        for k in COLUMNS[2:]:
+            row[k] = f"{income * rnd.uniform(0.0, 0.3):.2f}"
+        rows.append(row)
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input", dest="incsv", help="CSV to benchmark (default: synthetic rows)")
+    ap.add_argument("--rows", type=int, default=50000, help="Synthetic row count")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    if args.incsv:
+        with open(args.incsv, "r", encoding="utf-8-sig") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        rows = synthetic_rows(args.rows)
+
+    def best_of(fn):
+        best = float("inf")
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            out = fn()
+            best = min(best, time.perf_counter() - t0)
+        return best, out
+
+    t_iter, ref = best_of(lambda: [iterative_rebalance_row(r)[0] for r in rows])
+    t_vec, (out, _) = best_of(lambda: rebalance_rows(rows))
+
+    # Rule math alone, both sides on the same pre-parsed, normalized shares
+    cats = COLUMNS[2:]
+    ages = [float(r["Age"]) for r in rows]
+    shares = np.random.default_rng(0).uniform(0.0, 0.3, (len(rows), len(cats)))
+    shares /= shares.sum(axis=1, keepdims=True)
+    share_dicts = [dict(zip(cats, row)) for row in shares.tolist()]
+    floors, caps = category_limits(ages, cats)
+    flex, topup, critical = category_masks(cats)
+    sav = cats.index("Savings")
+
+    def engine():
+        pr = apply_savings_target(shares.copy(), caps, sav)
+        return project(pr, floors, caps, flex, topup, critical, savings=sav)[0]
+
+    t_iter_core, _ = best_of(lambda: [iterative_shares(dict(d), a) for d, a in zip(share_dicts, ages)])
+    t_proj, _ = best_of(engine)
+
+    max_diff = max(
+        abs(float(a[k]) - float(b[k]))
+        for a, b in zip(ref, out) for k in COLUMNS[2:]
+    )
+    print(f"📊 Rows: {len(rows)}")
+    print(f"   Iterative rows : {t_iter * 1000:9.1f} ms ({len(rows) / t_iter:,.0f} rows/s)")
+    print(f"   Vectorized     : {t_vec * 1000:9.1f} ms ({len(rows) / t_vec:,.0f} rows/s)")
+    print(f"   Rules, per row : {t_iter_core * 1000:9.1f} ms ({len(rows) / t_iter_core:,.0f} rows/s)")
+    print(f"   Rules, batched : {t_proj * 1000:9.1f} ms ({len(rows) / t_proj:,.0f} rows/s)")
+    print(f"   Speedup        : {t_iter / t_vec:9.1f}x end to end, {t_iter_core / t_proj:.1f}x rule math")
+    print(f"   Max diff (Rs.) : {max_diff:9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# bench_json.py
+# Benchmark: encode time and bytes-on-wire for chatbot grounding payloads.
+#
+#   python bench_json.py --transactions 2000 --sms 1000
+#
+# Compares Flask's default stdlib encoding (sorted keys, ASCII escapes)
+# against orjson, and the size of each payload raw, gzipped and brotli'd.
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from fast_json import brotli, compress, orjson
+
+MERCHANTS = ["Keells Super", "Cargills Food City", "PickMe", "Uber", "Dialog Axiata",
+             "CEB Bill Payment", "Arpico", "Odel", "Softlogic Pharmacy", "Laugfs Gas"]
+CATEGORIES = ["Food", "Transport", "Housing", "Utilities", "Entertainment",
+              "Savings", "Healthcare", "Education", "Emergency", "Shopping"]
+
+
+def grounding_payload(n_transactions, n_sms, seed=7):
+    """Grounding dict shaped like the one chatbot() returns."""
+    rnd = random.Random(seed)
+    user_id = str(uuid.UUID(int=rnd.getrandbits(128)))
+    start = datetime(2025, 1, 1)
+
+    def ts():
+        return (start + timedelta(minutes=rnd.randint(0, 400000))).isoformat() + "+00:00"
+
+    categories = [
+        {"id": i + 1, "user_id": user_id, "name": name, "type": "expense",
+         "icon": name.lower(), "color": f"#{rnd.randint(0, 0xFFFFFF):06x}",
+         "limit": rnd.randint(5000, 50000), "created_at": ts()}
+        for i, name in enumerate(CATEGORIES)
+    ]
+    accounts = [
+        {"id": str(uuid.UUID(int=rnd.getrandbits(128))), "user_id": user_id,
+         "name": name, "balance": round(rnd.uniform(0, 500000), 2), "created_at": ts()}
+        for name in ("Cash", "Commercial Bank", "Sampath Bank", "HNB Credit Card")
+    ]
+    transactions = [
+        {"id": str(uuid.UUID(int=rnd.getrandbits(128))), "user_id": user_id,
+         "account_id": rnd.choice(accounts)["id"], "category_id": rnd.randint(1, len(CATEGORIES)),
+         "type": rnd.choice(["expense", "expense", "expense", "income"]),
+         "amount": round(rnd.uniform(100, 25000), 2),
+         "description": f"{rnd.choice(MERCHANTS)} {rnd.randint(100, 999)}",
+         "date": ts(), "created_at": ts()}
+        for _ in range(n_transactions)
+    ]
+    sms_records = [
+        {"id": str(uuid.UUID(int=rnd.getrandbits(128))), "user_id": user_id,
+         "sender": rnd.choice(["COMBANK", "SAMPATH", "HNB"]),
+         "body": (f"Your A/C XXXXXXXX{rnd.randint(1000, 9999)} has been debited by LKR "
+                  f"{rnd.uniform(100, 25000):,.2f} at {rnd.choice(MERCHANTS)} on "
+                  f"{ts()[:10]}. Avl Bal LKR {rnd.uniform(0, 500000):,.2f}. Call 011 2 353 353 for queries."),
+         "amount": round(rnd.uniform(100, 25000), 2), "parsed": rnd.random() < 0.8,
+         "received_at": ts()}
+        for _ in range(n_sms)
+    ]
+    expenses = [{"name": c, "amount": round(rnd.uniform(1000, 60000), 2)} for c in CATEGORIES]
+    return {
+        "age": 29.0,
+        "income": {"main_income": 150000.0, "extras": [{"source": "Freelance", "amount": 25000.0}],
+                   "total": 175000.0},
+        "expenses": {"items": expenses, "total": sum(e["amount"] for e in expenses)},
+        "accounts": accounts,
+        "transactions": transactions,
+        "sms_records": sms_records,
+        "categories": categories,
+        "savings": 42000.0,
+        "savings_rate": 24.0,
+        "benchmark": {"mean_income": 160000, "savings_rate": 12},
+        "model_suggestion": 30500.0,
+    }
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--transactions", type=int, default=2000)
+    ap.add_argument("--sms", type=int, default=1000)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    payload = {"message": "Here is your plan...", "grounding_used": grounding_payload(args.transactions, args.sms)}
+
+    encoders = {
+        # What Flask's DefaultJSONProvider does out of debug mode
+        "stdlib (flask default)": lambda: json.dumps(
+            payload, ensure_ascii=True, sort_keys=True, separators=(",", ":")).encode(),
+        "stdlib (unsorted)": lambda: json.dumps(payload, separators=(",", ":")).encode(),
+    }
+    if orjson is not None:
+        encoders["orjson"] = lambda: orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+
+    print(f"📊 Payload: {args.transactions} transactions, {args.sms} SMS records")
+    print("   Encode time")
+    body = None
+    for name, fn in encoders.items():
+        t, body = best_of(fn, args.repeat)
+        print(f"     {name:24s} {t * 1000:8.2f} ms  {len(body):>10,} bytes")
+
+    print("   Bytes on wire")
+    print(f"     {'identity':24s} {len(body):>10,} bytes")
+    for label, encoding, kwargs in (
+        ("gzip -6", "gzip", {"gzip_level": 6}),
+        ("gzip -1", "gzip", {"gzip_level": 1}),
+        ("br q4", "br", {"brotli_quality": 4}),
+        ("br q6", "br", {"brotli_quality": 6}),
+    ):
+        if encoding == "br" and brotli is None:
+            print(f"     {label:24s} (brotli not installed)")
+            continue
+        t, data = best_of(lambda: compress(body, encoding, **kwargs), max(1, args.repeat // 4))
+        print(f"     {label:24s} {len(data):>10,} bytes  "
+              f"({len(data) / len(body):6.1%}, {t * 1000:.2f} ms)")
+
+
+if __name__ == "__main__":
+    main()
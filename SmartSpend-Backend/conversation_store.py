@@ -0,0 +1,196 @@
+# conversation_store.py
+# Server-side chatbot conversation memory.
+#
+# Each conversation keeps its last KEEP_TURNS turns verbatim. Older turns are
+# folded into a rolling summary capped at SUMMARY_MAX_CHARS, so the history
+# part of a prompt stays bounded however long the conversation runs. The
+# user's financial summary is cached on the conversation for
+# GROUNDING_TTL_SECONDS, so follow-ups don't re-query Supabase.
+#
+# Two backends: an in-process dict with TTL (per gunicorn worker) and a local
+# SQLite file shared by all workers on the host.
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+KEEP_TURNS = int(os.getenv("CONVERSATION_KEEP_TURNS", "4"))
+SUMMARY_MAX_CHARS = int(os.getenv("CONVERSATION_SUMMARY_MAX_CHARS", "1500"))
+TURN_MAX_CHARS = int(os.getenv("CONVERSATION_TURN_MAX_CHARS", "2000"))
+TTL_SECONDS = int(os.getenv("CONVERSATION_TTL_SECONDS", "3600"))
+GROUNDING_TTL_SECONDS = int(os.getenv("CONVERSATION_GROUNDING_TTL_SECONDS", "300"))
+MAX_PROMPT_HISTORY = 50
+
+# A follow-up is a short message made only of these words (and numbers), so
+# it can't carry a new topic of its own: "why?", "and next month?", "tell me more"
+FOLLOW_UP_WORDS = {
+    "why", "how", "what", "which", "when", "where", "about", "and", "or", "but",
+    "so", "then", "also", "instead", "else", "other", "again", "more", "less",
+    "much", "many", "enough", "that", "this", "it", "its", "those", "these",
+    "them", "there", "one", "ones", "next", "last", "previous", "month", "months",
+    "week", "weeks", "year", "years", "explain", "elaborate", "example",
+    "examples", "tell", "show", "me", "us", "please", "really", "ok", "okay",
+    "yes", "no", "sure", "thanks", "thank", "you", "is", "are", "was", "be",
+    "do", "does", "did", "can", "could", "would", "should", "i", "my", "the",
+    "a", "an", "of", "to", "for", "in", "on", "with", "if",
+}
+FOLLOW_UP_MAX_WORDS = 8
+
+
+def _clip(text, limit):
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def _first_sentence(text):
+    plain = re.sub(r"[*#`_]+", "", str(text or ""))
+    plain = " ".join(plain.split())
+    m = re.search(r"(.+?[.!?])(\s|$)", plain)
+    return m.group(1) if m else plain
+
+
+def summarize_turn(turn):
+    """One summary line for a turn leaving the verbatim window."""
+    return f"- User asked: {_clip(turn['user'], 160)} | Assistant: {_clip(_first_sentence(turn['assistant']), 200)}"
+
+
+def empty_state():
+    return {"summary": "", "turns": [], "turn_count": 0, "prompt_chars": [], "updated_at": time.time()}
+
+
+def add_turn(state, user_msg, reply, prompt_chars,
+             keep_turns=KEEP_TURNS, summary_max_chars=SUMMARY_MAX_CHARS):
+    """Append a turn, then compact anything beyond the verbatim window into the summary."""
+    state["turns"].append({
+        "user": user_msg[:TURN_MAX_CHARS],
+        "assistant": reply[:TURN_MAX_CHARS],
+        "prompt_chars": prompt_chars,
+        "at": time.time(),
+    })
+    state["turn_count"] += 1
+    state["prompt_chars"] = (state["prompt_chars"] + [prompt_chars])[-MAX_PROMPT_HISTORY:]
+
+    overflow = state["turns"][:-keep_turns] if keep_turns > 0 else state["turns"]
+    if overflow:
+        state["turns"] = state["turns"][len(overflow):]
+        lines = [l for l in state["summary"].splitlines() if l]
+        lines += [summarize_turn(t) for t in overflow]
+        # Drop the oldest lines once the summary is over budget
+        while lines and len("\n".join(lines)) > summary_max_chars:
+            lines.pop(0)
+        state["summary"] = "\n".join(lines)
+    state["updated_at"] = time.time()
+    return state
+
+
+def cached_grounding(state, ttl=GROUNDING_TTL_SECONDS):
+    """The conversation's grounding summary if fetched within ttl seconds, else None."""
+    if state.get("grounding") is None or time.time() - state.get("grounding_at", 0) > ttl:
+        return None
+    return state["grounding"]
+
+
+def set_grounding(state, grounding):
+    state["grounding"] = grounding
+    state["grounding_at"] = time.time()
+    return state
+
+
+def is_follow_up(msg):
+    """True for a short message with no content words of its own."""
+    words = re.findall(r"\w+", str(msg).lower())
+    if not words or len(words) > FOLLOW_UP_MAX_WORDS:
+        return False
+    return all(w in FOLLOW_UP_WORDS or w.isdigit() for w in words)
+
+
+def history_prompt(state):
+    """Prompt section describing the conversation so far ("" for a new conversation)."""
+    if not state["summary"] and not state["turns"]:
+        return ""
+    parts = ["Conversation so far:"]
+    if state["summary"]:
+        parts.append("Earlier in this conversation:\n" + state["summary"])
+    if state["turns"]:
+        parts.append("Most recent messages:")
+        for t in state["turns"]:
+            parts.append(f"User: {t['user']}\nAssistant: {t['assistant']}")
+    return "\n".join(parts)
+
+
+class MemoryConversationStore:
+    def __init__(self, ttl=TTL_SECONDS, max_conversations=10000):
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            state = self._data.get(key)
+            if state is None or time.time() - state["updated_at"] > self.ttl:
+                self._data.pop(key, None)
+                return empty_state()
+            self._data.move_to_end(key)
+            return json.loads(json.dumps(state))
+
+    def save(self, key, state):
+        with self._lock:
+            self._data[key] = state
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_conversations:
+                self._data.popitem(last=False)
+
+    def clear(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SqliteConversationStore:
+    def __init__(self, path, ttl=TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS conversations (
+                       key        TEXT PRIMARY KEY,
+                       state      TEXT NOT NULL,
+                       updated_at REAL NOT NULL
+                   )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated_at)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT state, updated_at FROM conversations WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return empty_state()
+        return json.loads(row[0])
+
+    def save(self, key, state):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO conversations (key, state, updated_at) VALUES (?, ?, ?)",
+                (key, json.dumps(state), state["updated_at"]))
+            conn.execute("DELETE FROM conversations WHERE updated_at < ?", (time.time() - self.ttl,))
+
+    def clear(self, key):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM conversations WHERE key = ?", (key,))
+
+
+def from_env():
+    if os.getenv("CONVERSATION_STORE", "memory").lower() == "sqlite":
+        return SqliteConversationStore(os.getenv("CONVERSATION_STORE_PATH", "conversations.sqlite3"))
+    return MemoryConversationStore()
@@ -1,6 +1,10 @@
+import argparse
+
 import pandas as pd
 from supabase_client import supabase
 
+from feature_store import EMPLOYMENT_CODES, GENDER_CODES, FeatureStore
+
 def fetch_profiles():
     response = supabase.table("users").select("id, age, monthly_income, gender, employment, dependents").execute()
     return pd.DataFrame(response.data)
@@ -28,11 +32,14 @@ def fetch_expenses_with_category_names():
 
     return raw[["user_id", "category", "amount"]]
 
-def prepare_training_data():
-    print("🔄 Fetching from Supabase...")
-
-    users_df = fetch_profiles()
-    expenses_df = fetch_expenses_with_category_names()
+def prepare_training_data(from_feature_store=False):
+    if from_feature_store:
+        print("🔄 Reading from feature store...")
+        users_df, expenses_df = FeatureStore().training_frames()
+    else:
+        print("🔄 Fetching from Supabase...")
+        users_df = fetch_profiles()
+        expenses_df = fetch_expenses_with_category_names()
 
     if users_df.empty or expenses_df.empty:
         print("⚠️ No user or expense data found.")
@@ -52,10 +59,8 @@ def prepare_training_data():
     merged = merged.dropna(subset=["monthly_income", "age", "gender", "employment"])
 
     # Normalize categorical fields
-    merged["Gender"] = merged["gender"].str.lower().map({"male": 0, "female": 1})
-    merged["Employment"] = merged["employment"].str.lower().map({
-        "unemployed": 0, "employed": 1, "student": 2
-    })
+    merged["Gender"] = merged["gender"].str.lower().map(GENDER_CODES)
+    merged["Employment"] = merged["employment"].str.lower().map(EMPLOYMENT_CODES)
 
     # Convert other fields
     merged["Income"] = pd.to_numeric(merged["monthly_income"], errors='coerce')
@@ -71,4 +76,8 @@ def prepare_training_data():
     print("✅ Exported real_training_data.csv with", len(final_df), "rows.")
 
 if __name__ == "__main__":
-    prepare_training_data()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--from-feature-store", action="store_true",
+                    help="Read users and spend totals from the local feature store instead of Supabase")
+    args = ap.parse_args()
+    prepare_training_data(from_feature_store=args.from_feature_store)
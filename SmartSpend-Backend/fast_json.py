@@ -0,0 +1,152 @@
+# fast_json.py
+# Faster JSON for Flask responses, and negotiated response compression.
+#
+# init_app(app) installs an orjson-backed JSON provider when orjson is
+# available (stdlib json otherwise) and compresses responses above
+# JSON_COMPRESS_MIN_BYTES with brotli (if installed) or gzip, following the
+# client's Accept-Encoding.
+import gzip
+import math
+import os
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ("application/json", "text/")
+
+
+def _as_orjson(obj):
+    """Copy of obj for the stdlib path, with numpy values as Python values and
+    NaN / infinity as None, the way orjson writes them."""
+    if type(obj).__module__ == "numpy" and hasattr(obj, "tolist"):
+        obj = obj.tolist()
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _as_orjson(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_as_orjson(v) for v in obj]
+    return obj
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """DefaultJSONProvider with orjson doing the encoding.
+
+    Anything orjson can't encode (or calls with custom json.dumps arguments)
+    goes through the stdlib provider, so output stays valid either way. Both
+    paths write dates the way Flask does (HTTP dates, via self.default), numpy
+    values as plain JSON and non-finite floats as null.
+    """
+
+    def _options(self):
+        opts = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            opts |= orjson.OPT_SORT_KEYS
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            opts |= orjson.OPT_INDENT_2
+        return opts
+
+    def _encode(self, obj):
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._options())
+        except TypeError:
+            return super().dumps(_as_orjson(obj), separators=(",", ":")).encode()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._encode(obj) + b"\n", mimetype=self.mimetype)
+
+
+def _accepted(header):
+    """Parse Accept-Encoding into {coding: q}."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate_encoding(header):
+    """Best supported content coding for an Accept-Encoding header (None for identity)."""
+    accepted = _accepted(header or "")
+    supported = (["br"] if brotli else []) + ["gzip"]
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding in supported:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(data, encoding, gzip_level=6, brotli_quality=4):
+    if encoding == "br":
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+def init_compression(app, min_size=1024, gzip_level=6, brotli_quality=4):
+    @app.after_request
+    def _compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or not 200 <= response.status_code < 300 or response.status_code == 204
+                or "Content-Encoding" in response.headers
+                or not (response.mimetype or "").startswith(COMPRESSIBLE)):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        if response.content_length is not None and response.content_length < min_size:
+            return response
+        encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+        if encoding is None:
+            return response
+
+        response.set_data(compress(response.get_data(), encoding, gzip_level, brotli_quality))
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+
+def init_app(app):
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+        # Clients don't rely on key order, so skip the sort
+        app.json.sort_keys = False
+    print(f"🧾 JSON encoder: {'orjson' if orjson else 'stdlib json'}, "
+          f"compression: {'br, gzip' if brotli else 'gzip'}")
+    init_compression(
+        app,
+        min_size=int(os.getenv("JSON_COMPRESS_MIN_BYTES", "1024")),
+        gzip_level=int(os.getenv("JSON_GZIP_LEVEL", "6")),
+        brotli_quality=int(os.getenv("JSON_BROTLI_QUALITY", "4")),
+    )
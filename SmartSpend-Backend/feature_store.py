@@ -0,0 +1,307 @@
+# feature_store.py
+# Per-user feature store (local SQLite stand-in).
+#
+# Keeps each user's profile features and running income / spend totals so the
+# chatbot can do one keyed lookup instead of re-aggregating raw rows, and the
+# training export can read the same features without extra Supabase queries.
+#
+# Totals are maintained incrementally from Supabase database webhooks
+# (INSERT / UPDATE / DELETE on users, income, expenses and categories). UPDATE
+# and DELETE need the old row, so those tables should use REPLICA IDENTITY FULL.
+# Without webhooks, load_user re-backfills entries older than a max age instead.
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from supabase_pages import fetch_all
+
+STORE_PATH = os.getenv("FEATURE_STORE_PATH", "feature_store.sqlite3")
+
+# User ids per .in_() filter when backfilling many users (keeps URLs short)
+BACKFILL_BATCH = 100
+
+# Same encodings the training export has always used
+GENDER_CODES = {"male": 0, "female": 1}
+EMPLOYMENT_CODES = {"unemployed": 0, "employed": 1, "student": 2}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_profile (
+    user_id        TEXT PRIMARY KEY,
+    age            REAL,
+    monthly_income REAL,
+    gender         TEXT,
+    employment     TEXT,
+    dependents     INTEGER,
+    updated_at     REAL
+);
+CREATE TABLE IF NOT EXISTS user_income (
+    user_id TEXT NOT NULL,
+    source  TEXT NOT NULL,
+    amount  REAL NOT NULL DEFAULT 0,
+    n       INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, source)
+);
+CREATE TABLE IF NOT EXISTS user_spend (
+    user_id     TEXT NOT NULL,
+    category_id TEXT NOT NULL,
+    name        TEXT,
+    amount      REAL NOT NULL DEFAULT 0,
+    n           INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, category_id)
+);
+CREATE TABLE IF NOT EXISTS category_name (
+    category_id TEXT PRIMARY KEY,
+    name        TEXT
+);
+"""
+
+
+def _num(v, default=0.0):
+    try:
+        return float(v)
+    except:
+        return float(default)
+
+
+def _num_or_none(v):
+    """float(v), or None when the value is missing or not a number (stored as NULL)."""
+    if v is None:
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _spend_key(record):
+    cat_id = record.get("category_id")
+    return str(cat_id) if cat_id is not None else f"name:{record.get('name') or 'Other'}"
+
+
+class FeatureStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # ---------- Incremental updates ----------
+    def apply_change(self, table, op, record=None, old_record=None):
+        """Apply one row change from Supabase (op is INSERT, UPDATE or DELETE)."""
+        op = (op or "").upper()
+        record = record if op in ("INSERT", "UPDATE") else None
+        old_record = old_record if op in ("UPDATE", "DELETE") else None
+
+        with self._conn() as conn:
+            if table == "users":
+                if record:
+                    self._upsert_profile(conn, record)
+                elif old_record:
+                    self._delete_user(conn, old_record.get("id"))
+            elif table == "income":
+                if old_record:
+                    self._add_income(conn, old_record, sign=-1)
+                if record:
+                    self._add_income(conn, record, sign=1)
+            elif table == "expenses":
+                if old_record:
+                    self._add_spend(conn, old_record, sign=-1)
+                if record:
+                    self._add_spend(conn, record, sign=1)
+            elif table == "categories":
+                if record:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO category_name (category_id, name) VALUES (?, ?)",
+                        (str(record.get("id")), record.get("name")))
+                elif old_record:
+                    conn.execute("DELETE FROM category_name WHERE category_id = ?",
+                                 (str(old_record.get("id")),))
+            else:
+                return False
+        return True
+
+    def _upsert_profile(self, conn, row):
+        conn.execute(
+            """INSERT INTO user_profile
+                   (user_id, age, monthly_income, gender, employment, dependents, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(user_id) DO UPDATE SET
+                   age = excluded.age, monthly_income = excluded.monthly_income,
+                   gender = excluded.gender, employment = excluded.employment,
+                   dependents = excluded.dependents, updated_at = excluded.updated_at""",
+            (str(row.get("id")), _num_or_none(row.get("age")), _num_or_none(row.get("monthly_income")),
+             row.get("gender"), row.get("employment"), row.get("dependents"),
+             time.time()))
+
+    def _delete_user(self, conn, user_id):
+        for table in ("user_profile", "user_income", "user_spend"):
+            conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (str(user_id),))
+
+    def _add_income(self, conn, row, sign):
+        if not row.get("user_id"):
+            return
+        key = (str(row["user_id"]), row.get("source") or "Other")
+        conn.execute(
+            """INSERT INTO user_income (user_id, source, amount, n) VALUES (?, ?, ?, ?)
+               ON CONFLICT(user_id, source) DO UPDATE SET
+                   amount = amount + excluded.amount, n = n + excluded.n""",
+            (*key, sign * _num(row.get("amount")), sign))
+        conn.execute("DELETE FROM user_income WHERE user_id = ? AND source = ? AND n <= 0", key)
+
+    def _add_spend(self, conn, row, sign):
+        if not row.get("user_id"):
+            return
+        key = (str(row["user_id"]), _spend_key(row))
+        conn.execute(
+            """INSERT INTO user_spend (user_id, category_id, name, amount, n) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(user_id, category_id) DO UPDATE SET
+                   amount = amount + excluded.amount, n = n + excluded.n,
+                   name = COALESCE(excluded.name, name)""",
+            (*key, row.get("name"), sign * _num(row.get("amount")), sign))
+        conn.execute("DELETE FROM user_spend WHERE user_id = ? AND category_id = ? AND n <= 0", key)
+
+    # ---------- Backfill ----------
+    def backfill_user(self, client, user_id):
+        """Rebuild one user's entry from raw Supabase rows."""
+        return self.backfill_users(client, [user_id]) > 0
+
+    def backfill_users(self, client, user_ids):
+        """Rebuild many users' entries, one query per table per BACKFILL_BATCH users.
+
+        Returns how many of the users exist in Supabase.
+        """
+        ids = list(dict.fromkeys(str(u) for u in user_ids))
+        found = 0
+        for start in range(0, len(ids), BACKFILL_BATCH):
+            batch = ids[start:start + BACKFILL_BATCH]
+            users = fetch_all(lambda: client.table("users").select(
+                "id, age, monthly_income, gender, employment, dependents").in_("id", batch).order("id"))
+            income = fetch_all(lambda: client.table("income").select("*").in_("user_id", batch).order("id"))
+            expenses = fetch_all(lambda: client.table("expenses").select("*").in_("user_id", batch).order("id"))
+            categories = fetch_all(lambda: client.table("categories").select(
+                "id, name").in_("user_id", batch).order("id"))
+            with self._conn() as conn:
+                for user_id in batch:
+                    self._delete_user(conn, user_id)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO category_name (category_id, name) VALUES (?, ?)",
+                    [(str(c.get("id")), c.get("name")) for c in categories])
+                for row in users:
+                    self._upsert_profile(conn, row)
+                for row in income:
+                    self._add_income(conn, row, sign=1)
+                for row in expenses:
+                    self._add_spend(conn, row, sign=1)
+            found += len(users)
+        return found
+
+    def rebuild(self, client):
+        """Rebuild the whole store from Supabase."""
+        users = fetch_all(lambda: client.table("users").select(
+            "id, age, monthly_income, gender, employment, dependents").order("id"))
+        income = fetch_all(lambda: client.table("income").select("*").order("id"))
+        expenses = fetch_all(lambda: client.table("expenses").select("*").order("id"))
+        categories = fetch_all(lambda: client.table("categories").select("id, name").order("id"))
+        with self._conn() as conn:
+            for table in ("user_profile", "user_income", "user_spend", "category_name"):
+                conn.execute(f"DELETE FROM {table}")
+            for row in users:
+                self._upsert_profile(conn, row)
+            for row in income:
+                self._add_income(conn, row, sign=1)
+            for row in expenses:
+                self._add_spend(conn, row, sign=1)
+            conn.executemany(
+                "INSERT OR REPLACE INTO category_name (category_id, name) VALUES (?, ?)",
+                [(str(c.get("id")), c.get("name")) for c in categories])
+        return len(users)
+
+    # ---------- Reads ----------
+    def load_user(self, client, user_id, max_age=None):
+        """get_user, backfilling from Supabase on a miss or when older than max_age seconds.
+
+        max_age is for deployments without webhooks, where nothing else keeps
+        the store current; None trusts the stored entry.
+        """
+        return self.load_users(client, [user_id], max_age).get(str(user_id))
+
+    def load_users(self, client, user_ids, max_age=None):
+        """load_user for many users, backfilling all misses / stale entries in one batch.
+
+        Returns {user_id: features or None}.
+        """
+        features = {str(u): self.get_user(u) for u in user_ids}
+        now = time.time()
+        refresh = [
+            uid for uid, f in features.items()
+            if f is None or (max_age is not None and now - (f["profile"].get("updated_at") or 0) > max_age)
+        ]
+        if refresh:
+            self.backfill_users(client, refresh)
+            features.update({uid: self.get_user(uid) for uid in refresh})
+        return features
+
+    def get_user(self, user_id):
+        """Profile, income sources and per-category spend for one user (None if unknown)."""
+        conn = self._conn()
+        profile = conn.execute("SELECT * FROM user_profile WHERE user_id = ?", (str(user_id),)).fetchone()
+        if profile is None:
+            return None
+        income = conn.execute(
+            "SELECT source, amount FROM user_income WHERE user_id = ?", (str(user_id),)).fetchall()
+        spend = conn.execute(
+            """SELECT s.category_id, COALESCE(c.name, s.name) AS name, s.amount
+               FROM user_spend s LEFT JOIN category_name c ON c.category_id = s.category_id
+               WHERE s.user_id = ?""", (str(user_id),)).fetchall()
+        return {
+            "profile": dict(profile),
+            "income": [dict(r) for r in income],
+            "spend": [dict(r) for r in spend],
+        }
+
+    def training_frames(self):
+        """Users and per-category spend frames shaped like the Supabase export."""
+        conn = self._conn()
+        users = pd.read_sql_query(
+            """SELECT user_id AS id, age, monthly_income, gender, employment, dependents
+               FROM user_profile""", conn)
+        expenses = pd.read_sql_query(
+            """SELECT s.user_id, c.name AS category, s.amount
+               FROM user_spend s JOIN category_name c ON c.category_id = s.category_id""", conn)
+        return users, expenses
+
+
+def model_features(profile):
+    """Encode a stored profile with the same columns the training export writes.
+
+    Missing values and unknown codes are None (the export drops those users),
+    except Dependents, which the export fills with 0.
+    """
+    dependents = _num_or_none(profile.get("dependents"))
+    return {
+        "Age": _num_or_none(profile.get("age")),
+        "Income": _num_or_none(profile.get("monthly_income")),
+        "Gender": GENDER_CODES.get(str(profile.get("gender") or "").lower()),
+        "Employment": EMPLOYMENT_CODES.get(str(profile.get("employment") or "").lower()),
+        "Dependents": int(dependents) if dependents is not None else 0,
+    }
+
+
+if __name__ == "__main__":
+    from supabase_client import supabase
+
+    print("🔄 Rebuilding feature store from Supabase...")
+    print(f"✅ Stored features for {FeatureStore().rebuild(supabase)} users in {STORE_PATH}")
@@ -0,0 +1,322 @@
+# peer_percentiles.py
+# Precomputed per-band, per-category spending quantile sketches.
+#
+# A background job pulls the same users/expenses join that
+# export_supabase_training_data.py uses, restricted to the last WINDOW_DAYS,
+# buckets users by age band and income band, and stores a fixed quantile grid
+# per (band, category). Lookups then interpolate against the in-memory grid
+# instead of querying raw rows. Spends passed to a lookup must cover the same
+# window (fetch_user_window_spend does that for a user id).
+#
+# Only one process per host rebuilds the sketches (whichever holds the lock
+# file); the others reload the saved file when it changes.
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from allocation import age_band
+from supabase_pages import fetch_all
+
+SKETCH_PATH = os.getenv("PEER_PERCENTILES_PATH", "peer_percentiles.npz")
+
+# Spend window compared on both sides (peers and the user being looked up)
+WINDOW_DAYS = int(os.getenv("PEER_PERCENTILES_WINDOW_DAYS", "30"))
+
+# How often non-building processes check for a newer sketch file
+RELOAD_SECONDS = 60
+
+# Quantile grid stored per (band, category): 0%, 1%, ..., 100%
+QUANTILES = np.linspace(0.0, 1.0, 101)
+
+# Monthly income band edges (Rs.)
+INCOME_EDGES = [0, 50000, 100000, 200000, 400000]
+INCOME_LABELS = ["<50k", "50k-100k", "100k-200k", "200k-400k", "400k+"]
+
+# Bands with fewer users than this fall back to the age band alone
+MIN_BAND_USERS = 5
+
+ALL = "all"
+
+
+def income_band(income):
+    i = int(np.searchsorted(INCOME_EDGES, float(income), side="right")) - 1
+    return INCOME_LABELS[max(0, min(i, len(INCOME_LABELS) - 1))]
+
+
+def band_key(age, income):
+    return f"{age_band(age)}|{income_band(income)}"
+
+
+# ---------- Spend window ----------
+def window_start(today=None):
+    return ((today or date.today()) - timedelta(days=WINDOW_DAYS)).isoformat()
+
+
+def _window_expenses(client, user_id=None):
+    """Expense rows dated inside the window (rows without a date fall back to created_at)."""
+    start = window_start()
+
+    def query():
+        q = client.table("expenses").select("id, user_id, amount, category_id, categories(name)")
+        if user_id is not None:
+            q = q.eq("user_id", user_id)
+        return q.or_(f"date.gte.{start},and(date.is.null,created_at.gte.{start})").order("id")
+
+    return fetch_all(query)
+
+
+def _category_names(raw):
+    raw = raw.dropna(subset=["user_id", "amount", "categories"])
+    raw["category"] = raw["categories"].apply(lambda x: x.get("name") if isinstance(x, dict) else None)
+    raw = raw.dropna(subset=["category"])
+    raw["amount"] = pd.to_numeric(raw["amount"], errors="coerce").fillna(0.0)
+    return raw
+
+
+def fetch_user_window_spend(client, user_id):
+    """One user's per-category spend over the window, as {category: amount}."""
+    raw = pd.DataFrame(_window_expenses(client, user_id))
+    if raw.empty:
+        return {}
+    return _category_names(raw).groupby("category")["amount"].sum().to_dict()
+
+
+# ---------- Building sketches ----------
+def fetch_user_category_spend(client):
+    """Per-user, per-category spend over the window joined with age/income."""
+    users = pd.DataFrame(
+        fetch_all(lambda: client.table("users").select("id, age, monthly_income").order("id"))
+    )
+    raw = pd.DataFrame(_window_expenses(client))
+    if users.empty or raw.empty:
+        return pd.DataFrame()
+
+    raw = _category_names(raw)
+    pivot = raw.pivot_table(index="user_id", columns="category", values="amount", aggfunc="sum").fillna(0)
+
+    users["Age"] = pd.to_numeric(users["age"], errors="coerce")
+    users["Income"] = pd.to_numeric(users["monthly_income"], errors="coerce")
+    users = users.dropna(subset=["Age", "Income"])
+
+    return users[["id", "Age", "Income"]].merge(pivot, left_on="id", right_index=True, how="inner")
+
+
+def build_sketches(df):
+    """Quantile grid per band and category.
+
+    Returns {key: (categories, grid float32[n_cat, 101], counts int32[n_cat])}.
+    Every age band also gets an "<age>|all" entry used as a fallback.
+    """
+    if df.empty:
+        return {}
+
+    categories = [c for c in df.columns if c not in ("id", "Age", "Income")]
+    ages = df["Age"].map(age_band)
+    keys = ages + "|" + df["Income"].map(income_band)
+
+    groups = {}
+    for key, idx in keys.groupby(keys).groups.items():
+        groups[key] = idx
+    for band, idx in ages.groupby(ages).groups.items():
+        groups[f"{band}|{ALL}"] = idx
+    groups[f"{ALL}|{ALL}"] = df.index
+
+    sketches = {}
+    for key, idx in groups.items():
+        if len(idx) < MIN_BAND_USERS and not key.endswith(ALL):
+            continue
+        values = df.loc[idx, categories].to_numpy(dtype=np.float64)
+        # Users with no spend in a category are not peers for that category
+        cats, grid, counts = [], [], []
+        for j, cat in enumerate(categories):
+            col = values[:, j]
+            col = col[col > 0]
+            if col.size == 0:
+                continue
+            cats.append(cat)
+            grid.append(np.quantile(col, QUANTILES))
+            counts.append(col.size)
+        if cats:
+            sketches[key] = (
+                cats,
+                np.asarray(grid, dtype=np.float32),
+                np.asarray(counts, dtype=np.int32),
+            )
+    return sketches
+
+
+def save_sketches(sketches, path=SKETCH_PATH):
+    arrays = {}
+    for key, (cats, grid, counts) in sketches.items():
+        arrays[f"{key}::cats"] = np.asarray(cats)
+        arrays[f"{key}::grid"] = grid
+        arrays[f"{key}::counts"] = counts
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+    np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def load_sketches(path=SKETCH_PATH):
+    if not os.path.exists(path):
+        return {}
+    with np.load(path, allow_pickle=False) as npz:
+        keys = {name.rsplit("::", 1)[0] for name in npz.files}
+        return {
+            key: (
+                [str(c) for c in npz[f"{key}::cats"]],
+                npz[f"{key}::grid"],
+                npz[f"{key}::counts"],
+            )
+            for key in keys
+        }
+
+
+# ---------- In-memory table ----------
+class PeerPercentiles:
+    def __init__(self):
+        self._sketches = {}
+        self._index = {}
+        self.built_at = None
+
+    def replace(self, sketches, built_at=None):
+        index = {key: {c: i for i, c in enumerate(cats)} for key, (cats, _, _) in sketches.items()}
+        # Single reference swap so readers never see a half-built table
+        self._sketches, self._index = sketches, index
+        self.built_at = built_at or time.time()
+
+    @property
+    def ready(self):
+        return bool(self._sketches)
+
+    def _resolve(self, age, income):
+        ab = age_band(age)
+        for key in (f"{ab}|{income_band(income)}", f"{ab}|{ALL}", f"{ALL}|{ALL}"):
+            if key in self._sketches:
+                return key
+        return None
+
+    def lookup(self, age, income, spends):
+        """Percentile (0-100) of each category spend among peers in the band.
+
+        Categories without peer data map to None.
+        """
+        key = self._resolve(age, income)
+        result = {cat: None for cat in spends}
+        if key is None:
+            return key, result
+
+        _, grid, counts = self._sketches[key]
+        index = self._index[key]
+        names = [c for c in spends if c in index]
+        if not names:
+            return key, result
+
+        rows = np.fromiter((index[c] for c in names), dtype=np.intp, count=len(names))
+        values = np.fromiter((float(spends[c]) for c in names), dtype=np.float64, count=len(names))
+        pcts = interpolate_rows(grid[rows], values)
+        for cat, p, n in zip(names, pcts, counts[rows]):
+            result[cat] = {"percentile": round(float(p), 1), "peers": int(n)}
+        return key, result
+
+
+def interpolate_rows(grid, values):
+    """Row-wise inverse of the quantile grid: where each value sits in its row.
+
+    grid is [n, q] ascending per row, values is [n]. Vectorized over rows.
+    """
+    grid = np.asarray(grid, dtype=np.float64)
+    q = grid.shape[1] - 1
+    # Number of grid points <= value, per row
+    pos = (grid <= values[:, None]).sum(axis=1)
+    hi_idx = np.clip(pos, 1, q)
+    lo_idx = hi_idx - 1
+    rows = np.arange(grid.shape[0])
+    lo = grid[rows, lo_idx]
+    hi = grid[rows, hi_idx]
+    span = hi - lo
+    frac = np.where(span > 0, (values - lo) / np.where(span > 0, span, 1.0), 1.0)
+    frac = np.clip(frac, 0.0, 1.0)
+    pct = (lo_idx + frac) / q * 100.0
+    pct = np.where(pos == 0, 0.0, pct)
+    return np.where(pos > q, 100.0, pct)
+
+
+PEERS = PeerPercentiles()
+
+
+def refresh(client, path=SKETCH_PATH):
+    sketches = build_sketches(fetch_user_category_spend(client))
+    if sketches:
+        save_sketches(sketches, path)
+        PEERS.replace(sketches)
+    return len(sketches)
+
+
+def _acquire_builder_lock(path):
+    """Non-blocking exclusive lock; only its holder rebuilds. None if another process has it."""
+    try:
+        import fcntl
+    except ImportError:
+        return True  # no flock (Windows dev server runs a single process)
+    f = open(f"{path}.lock", "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return f  # keep the handle open to hold the lock
+    except OSError:
+        f.close()
+        return None
+
+
+def _reload_if_changed(path):
+    if not os.path.exists(path):
+        return
+    mtime = os.path.getmtime(path)
+    if PEERS.built_at is not None and mtime <= PEERS.built_at:
+        return
+    sketches = load_sketches(path)
+    if sketches:
+        PEERS.replace(sketches, built_at=mtime)
+        print(f"📦 Loaded {len(sketches)} peer percentile bands from {path}")
+
+
+def start_refresh_thread(client, interval, path=SKETCH_PATH):
+    """Keep PEERS current: rebuild every `interval` seconds if this process holds
+    the builder lock, otherwise reload the saved file whenever it changes."""
+
+    def run():
+        lock = None
+        next_build = 0.0
+        while True:
+            try:
+                if lock is None:
+                    lock = _acquire_builder_lock(path)
+                if lock is not None and time.time() >= next_build:
+                    n = refresh(client, path)
+                    next_build = time.time() + interval
+                    print(f"📈 Peer percentiles rebuilt: {n} bands")
+                else:
+                    _reload_if_changed(path)
+            except Exception as e:
+                print(f"❌ Peer percentile refresh failed: {e}")
+                next_build = time.time() + interval
+            time.sleep(min(interval, RELOAD_SECONDS))
+
+    try:
+        _reload_if_changed(path)
+    except Exception as e:
+        print(f"⚠️ Failed to load peer percentiles: {e}")
+
+    t = threading.Thread(target=run, name="peer-percentiles", daemon=True)
+    t.start()
+    return t
+
+
+if __name__ == "__main__":
+    from supabase_client import supabase
+
+    print("🔄 Building peer percentile sketches...")
+    print(f"✅ Wrote {refresh(supabase)} bands to {SKETCH_PATH}")
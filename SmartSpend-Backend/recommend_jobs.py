@@ -0,0 +1,309 @@
+# recommend_jobs.py
+# Asynchronous bulk recommendation jobs.
+#
+# Jobs and their results live in a local SQLite file so any gunicorn worker
+# can accept a job or answer a poll. Background worker threads claim queued
+# jobs, run them in chunks through a vectorized batch function and record
+# progress after every chunk. A running job holds a lease that its worker
+# renews; if the worker dies the lease runs out and the job is re-queued,
+# resuming after its last recorded chunk.
+#
+# When a job finishes its status is POSTed to the job's webhook_url, if it has
+# one. Webhooks only go to hosts listed in RECOMMEND_JOB_WEBHOOK_HOSTS, and are
+# signed when RECOMMEND_JOB_WEBHOOK_SECRET is set (X-Signature: sha256=<hex HMAC of body>).
+#
+# Finished jobs and their results are deleted after RECOMMEND_JOB_RETENTION_SECONDS.
+#
+# By default jobs run on RECOMMEND_JOB_WORKERS threads inside each web process.
+# A separate `python recommend_jobs.py` worker (with RECOMMEND_JOB_WORKERS=0 on
+# the web) is opt-in: it only works when it shares this SQLite file with the
+# web processes, i.e. runs on the same machine and disk. Heroku dynos and
+# Railway services each get their own filesystem, so don't split them there.
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+import requests
+
+JOBS_PATH = os.getenv("RECOMMEND_JOBS_PATH", "recommend_jobs.sqlite3")
+LEASE_SECONDS = int(os.getenv("RECOMMEND_JOB_LEASE_SECONDS", "120"))
+RETENTION_SECONDS = int(os.getenv("RECOMMEND_JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+SWEEP_INTERVAL = 3600
+WEBHOOK_HOSTS = {h.strip().lower() for h in os.getenv("RECOMMEND_JOB_WEBHOOK_HOSTS", "").split(",") if h.strip()}
+WEBHOOK_SECRET = os.getenv("RECOMMEND_JOB_WEBHOOK_SECRET")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,
+    total       INTEGER NOT NULL,
+    processed   INTEGER NOT NULL DEFAULT 0,
+    failed      INTEGER NOT NULL DEFAULT 0,
+    items       TEXT,
+    webhook_url TEXT,
+    webhook_status TEXT,
+    error       TEXT,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    worker_id   TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at);
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT NOT NULL,
+    idx    INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+# Columns added after the first release, for existing job files
+MIGRATIONS = {"worker_id": "TEXT", "lease_until": "REAL"}
+
+
+def webhook_allowed(url):
+    """True for an https URL (http for localhost) whose host is in WEBHOOK_HOSTS."""
+    try:
+        parsed = urlparse(str(url))
+    except ValueError:
+        return False
+    host = (parsed.hostname or "").lower()
+    secure = parsed.scheme == "https" or (parsed.scheme == "http" and host in ("localhost", "127.0.0.1"))
+    return secure and host in WEBHOOK_HOSTS
+
+
+def sign_payload(body, secret):
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+class JobQueue:
+    def __init__(self, process_batch, path=JOBS_PATH, chunk_size=500, poll_interval=2.0,
+                 lease_seconds=LEASE_SECONDS, retention_seconds=RETENTION_SECONDS):
+        """process_batch takes a list of items and returns one result dict per item."""
+        self.process_batch = process_batch
+        self.path = path
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self._last_sweep = 0.0
+        self._local = threading.local()
+        self._wake = threading.Event()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+        for name, kind in MIGRATIONS.items():
+            if name not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # ---------- Submitting / polling ----------
+    def submit(self, items, webhook_url=None):
+        job_id = uuid.uuid4().hex
+        self._conn().execute(
+            """INSERT INTO jobs (id, status, total, items, webhook_url, created_at)
+               VALUES (?, 'queued', ?, ?, ?, ?)""",
+            (job_id, len(items), json.dumps(items), webhook_url, time.time()))
+        self._wake.set()
+        return job_id
+
+    def status(self, job_id):
+        row = self._conn().execute(
+            """SELECT id, status, total, processed, failed, webhook_status, error,
+                      created_at, started_at, finished_at
+               FROM jobs WHERE id = ?""", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if job["started_at"]:
+            elapsed = (job["finished_at"] or time.time()) - job["started_at"]
+            rate = job["processed"] / elapsed if elapsed > 0 else 0.0
+            job["elapsed_seconds"] = round(elapsed, 3)
+            job["rows_per_second"] = round(rate, 1)
+            remaining = job["total"] - job["processed"]
+            running = job["status"] == "running"
+            job["eta_seconds"] = round(remaining / rate, 1) if running and rate > 0 and remaining > 0 else None
+        job["progress"] = round(job["processed"] / job["total"], 4) if job["total"] else 1.0
+        return job
+
+    def results(self, job_id, offset=0, limit=1000):
+        rows = self._conn().execute(
+            """SELECT idx, result FROM job_results WHERE job_id = ?
+               ORDER BY idx LIMIT ? OFFSET ?""", (job_id, limit, offset)).fetchall()
+        return [{"index": r["idx"], **json.loads(r["result"])} for r in rows]
+
+    def sweep(self, now=None):
+        """Delete jobs (and their results) that finished more than retention_seconds ago."""
+        cutoff = (now or time.time()) - self.retention_seconds
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                """DELETE FROM job_results WHERE job_id IN
+                       (SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?)""",
+                (cutoff,))
+            deleted = conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return deleted
+
+    # ---------- Workers ----------
+    def _claim(self, worker_id):
+        """Take the oldest queued job (or one whose lease ran out) for worker_id."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL WHERE status = 'running' AND lease_until < ?",
+                (now,))
+            row = conn.execute(
+                """SELECT id, items, processed, failed FROM jobs
+                   WHERE status = 'queued' ORDER BY created_at LIMIT 1""").fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                """UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?),
+                       worker_id = ?, lease_until = ? WHERE id = ?""",
+                (now, worker_id, now + self.lease_seconds, row["id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row["id"], json.loads(row["items"]), row["processed"], row["failed"]
+
+    def _renew(self, job_id, worker_id):
+        """Extend the lease; False once another worker has taken the job over."""
+        cur = self._conn().execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+            (time.time() + self.lease_seconds, job_id, worker_id))
+        return cur.rowcount == 1
+
+    def _heartbeat(self, job_id, worker_id, stop):
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                if not self._renew(job_id, worker_id):
+                    return
+            except Exception as e:
+                print(f"⚠️ Failed to renew lease on recommendation job {job_id}: {e}")
+
+    def _run(self, job_id, items, worker_id, processed=0, failed=0):
+        conn = self._conn()
+        stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job_id, worker_id, stop),
+                         name=f"recommend-lease-{job_id[:8]}", daemon=True).start()
+        try:
+            for start in range(processed, len(items), self.chunk_size):
+                chunk = items[start:start + self.chunk_size]
+                results = self.process_batch(chunk)
+                failed += sum(1 for r in results if "error" in r)
+                processed += len(chunk)
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO job_results (job_id, idx, result) VALUES (?, ?, ?)",
+                    [(job_id, start + i, json.dumps(r)) for i, r in enumerate(results)])
+                cur = conn.execute(
+                    """UPDATE jobs SET processed = ?, failed = ?, lease_until = ?
+                       WHERE id = ? AND worker_id = ? AND status = 'running'""",
+                    (processed, failed, time.time() + self.lease_seconds, job_id, worker_id))
+                if cur.rowcount != 1:
+                    conn.execute("ROLLBACK")
+                    print(f"⚠️ Lost the lease on recommendation job {job_id}; leaving it to its new worker")
+                    return
+                conn.execute("COMMIT")
+            conn.execute(
+                """UPDATE jobs SET status = 'done', items = NULL, finished_at = ?, lease_until = NULL
+                   WHERE id = ? AND worker_id = ?""",
+                (time.time(), job_id, worker_id))
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"❌ Recommendation job {job_id} failed: {e}")
+            conn.execute(
+                """UPDATE jobs SET status = 'failed', items = NULL, error = ?, finished_at = ?,
+                       lease_until = NULL WHERE id = ? AND worker_id = ?""",
+                (str(e), time.time(), job_id, worker_id))
+        finally:
+            stop.set()
+        self._deliver_webhook(job_id)
+
+    def _deliver_webhook(self, job_id):
+        row = self._conn().execute("SELECT webhook_url FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row or not row["webhook_url"]:
+            return
+        if not webhook_allowed(row["webhook_url"]):
+            outcome = "skipped: webhook host not allowed"
+        else:
+            body = json.dumps(self.status(job_id)).encode()
+            headers = {"Content-Type": "application/json"}
+            if WEBHOOK_SECRET:
+                headers["X-Signature"] = sign_payload(body, WEBHOOK_SECRET)
+            try:
+                resp = requests.post(row["webhook_url"], data=body, headers=headers,
+                                     timeout=10, allow_redirects=False)
+                outcome = str(resp.status_code)
+            except Exception as e:
+                outcome = f"error: {e}"
+        self._conn().execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", (outcome, job_id))
+
+    def _worker(self):
+        worker_id = f"{os.getpid()}:{threading.get_ident()}"
+        while True:
+            try:
+                job = self._claim(worker_id)
+            except Exception as e:
+                print(f"⚠️ Failed to claim recommendation job: {e}")
+                job = None
+            if job is None:
+                if time.time() - self._last_sweep > SWEEP_INTERVAL:
+                    self._last_sweep = time.time()
+                    try:
+                        deleted = self.sweep()
+                        if deleted:
+                            print(f"🧹 Removed {deleted} expired recommendation jobs")
+                    except Exception as e:
+                        print(f"⚠️ Failed to remove expired recommendation jobs: {e}")
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            job_id, items, processed, failed = job
+            resumed = f", resuming at {processed}" if processed else ""
+            print(f"🧮 Running recommendation job {job_id} ({len(items)} items{resumed})")
+            self._run(job_id, items, worker_id, processed, failed)
+
+    def start_workers(self, count):
+        for n in range(count):
+            threading.Thread(target=self._worker, name=f"recommend-job-{n}", daemon=True).start()
+
+
+if __name__ == "__main__":
+    # Opt-in standalone worker: must share JOBS_PATH with the web processes,
+    # which then run with RECOMMEND_JOB_WORKERS=0 and only enqueue
+    os.environ["RECOMMEND_JOB_WORKERS"] = "0"
+    os.environ.setdefault("PEER_PERCENTILES_REFRESH_SECONDS", "0")
+    import app
+
+    threads = int(os.getenv("RECOMMEND_WORKER_THREADS", "2"))
+    app.JOB_QUEUE.start_workers(threads)
+    print(f"🚀 Recommendation job worker started with {threads} threads")
+    threading.Event().wait()
@@ -0,0 +1,162 @@
+# request_profiler.py
+# Opt-in per-request profiling for the Flask app.
+#
+# A request is profiled when it carries the admin header matching
+# PROFILE_ADMIN_TOKEN, or when it is picked by PROFILE_SAMPLE_RATE. Each
+# profiled request writes a cProfile dump (.prof, readable with pstats or
+# snakeviz) and a collapsed-stack file (.collapsed, for flamegraph.pl or
+# speedscope) into PROFILE_DIR, which is pruned to PROFILE_MAX_FILES profiles.
+#
+# When neither the token nor a sample rate is configured no hooks are
+# registered, so a disabled profiler costs nothing per request.
+import cProfile
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import g, request
+
+PROFILE_HEADER = "X-Profile-Token"
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer and counts collapsed stacks."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    def __init__(self, directory, sample_rate=0.0, admin_token=None, max_files=200,
+                 interval=0.005, mode="both"):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.admin_token = admin_token
+        self.max_files = max_files
+        self.interval = interval
+        self.use_cprofile = mode in ("cprofile", "both")
+        self.use_sampler = mode in ("sample", "both")
+        # cProfile and the sampler are per request; only one profile at a time
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.admin_token) or self.sample_rate > 0
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self._before)
+        app.teardown_request(self._teardown)
+        print(f"🔬 Request profiling on (sample rate {self.sample_rate}, dir {self.directory})")
+
+    def _wanted(self):
+        token = request.headers.get(PROFILE_HEADER)
+        if self.admin_token and token and hmac.compare_digest(token.encode(), self.admin_token.encode()):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _before(self):
+        if not self._wanted() or not self._lock.acquire(blocking=False):
+            return
+        g._profile_started = time.perf_counter()
+        g._profile_cprofile = cProfile.Profile() if self.use_cprofile else None
+        g._profile_sampler = StackSampler(threading.get_ident(), self.interval) if self.use_sampler else None
+        if g._profile_sampler:
+            g._profile_sampler.start()
+        if g._profile_cprofile:
+            g._profile_cprofile.enable()
+
+    def _teardown(self, exc=None):
+        started = g.pop("_profile_started", None)
+        if started is None:
+            return
+        prof = g.pop("_profile_cprofile", None)
+        sampler = g.pop("_profile_sampler", None)
+        try:
+            if prof:
+                prof.disable()
+            if sampler:
+                sampler.stop()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            endpoint = re.sub(r"[^\w.-]+", "_", request.endpoint or request.path).strip("_") or "root"
+            now = time.time()
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f".{int(now * 1000) % 1000:03d}"
+            name = f"{stamp}_{os.getpid()}_{endpoint}_{elapsed_ms:.0f}ms_{uuid.uuid4().hex[:8]}"
+            base = os.path.join(self.directory, name)
+            if prof:
+                prof.dump_stats(base + ".prof")
+            if sampler:
+                with open(base + ".collapsed", "w", encoding="utf-8") as f:
+                    f.write(sampler.collapsed())
+            self._prune()
+            print(f"🔬 Profiled {request.method} {request.path} in {elapsed_ms:.0f}ms -> {base}")
+        except Exception as e:
+            print(f"⚠️ Failed to write request profile: {e}")
+        finally:
+            self._lock.release()
+
+    def _prune(self):
+        """Keep the newest max_files profiles; a .prof and its .collapsed go together."""
+        profiles = {}
+        for f in os.listdir(self.directory):
+            stem, ext = os.path.splitext(f)
+            if ext in (".prof", ".collapsed"):
+                path = os.path.join(self.directory, f)
+                profiles.setdefault(stem, []).append(path)
+        if len(profiles) <= self.max_files:
+            return
+
+        def newest(stem):
+            return max(os.path.getmtime(p) for p in profiles[stem])
+
+        for stem in sorted(profiles, key=newest)[:len(profiles) - self.max_files]:
+            for path in profiles[stem]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def from_env():
+    return RequestProfiler(
+        directory=os.getenv("PROFILE_DIR", "profiles"),
+        sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+        admin_token=os.getenv("PROFILE_ADMIN_TOKEN") or None,
+        max_files=int(os.getenv("PROFILE_MAX_FILES", "200")),
+        interval=float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000,
+        mode=os.getenv("PROFILE_MODE", "both"),
+    )
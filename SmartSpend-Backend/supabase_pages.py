@@ -0,0 +1,26 @@
+# supabase_pages.py
+# Paged reads for population-wide Supabase selects.
+#
+# PostgREST caps every response at its max-rows setting (1000 by default), so
+# a single .execute() on a growing table silently returns a truncated result.
+# fetch_all walks the table with .range() instead. SUPABASE_PAGE_SIZE must
+# not exceed the project's max-rows, or the first short page ends the walk.
+import os
+
+PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "1000"))
+
+
+def fetch_all(make_query, page_size=PAGE_SIZE):
+    """Every row of a query, one .range() page at a time until a short page comes back.
+
+    make_query returns a fresh, ordered query builder on each call (ranges on
+    an unordered query can skip or repeat rows between pages).
+    """
+    rows = []
+    start = 0
+    while True:
+        page = make_query().range(start, start + page_size - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        start += page_size
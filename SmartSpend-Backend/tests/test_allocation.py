@@ -0,0 +1,99 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from allocation import (  # noqa: E402
+    SAVINGS_TARGET, allocate, apply_savings_target, category_limits,
+    category_masks, project,
+)
+from bench_allocation import iterative_rebalance_row, synthetic_rows  # noqa: E402
+from rebalance_dataset import COLUMNS, rebalance_rows  # noqa: E402
+
+INCOME = 100000.0
+
+
+def _draft(shares):
+    return {name: share * INCOME for name, share in shares.items()}
+
+
+def _allocate_one(draft, age=30, savings_target=None):
+    (allocation, unallocated), = allocate([age], [INCOME], [draft], [savings_target])
+    return allocation, unallocated
+
+
+def test_partial_list_does_not_pile_onto_single_essential():
+    allocation, unallocated = _allocate_one(_draft({"Food": 0.25, "Rent": 0.03, "Fun": 0.03}))
+    assert allocation["Food"] == pytest.approx(25000.0)
+    assert sum(allocation.values()) + unallocated == pytest.approx(INCOME)
+    assert unallocated > 0
+
+
+def test_leftover_goes_to_savings_up_to_cap():
+    allocation, unallocated = _allocate_one(_draft({"Food": 0.25, "Savings": 0.10}), age=40)
+    assert allocation["Food"] == pytest.approx(25000.0)
+    assert allocation["Savings"] == pytest.approx(20000.0)  # mid-age cap
+    assert unallocated == pytest.approx(55000.0)
+
+
+def test_caps_hold_when_income_cannot_be_met():
+    allocation, unallocated = _allocate_one(_draft({"Housing": 0.20}))
+    assert allocation["Housing"] <= 0.35 * INCOME + 0.01
+    assert sum(allocation.values()) + unallocated == pytest.approx(INCOME)
+
+
+def test_savings_target_applied_for_api_callers():
+    draft = _draft({"Food": 0.25, "Housing": 0.20, "Transport": 0.15, "Utilities": 0.08,
+                    "Healthcare": 0.05, "Savings": 0.05})
+    allocation, unallocated = _allocate_one(draft)
+    assert allocation["Savings"] == pytest.approx(SAVINGS_TARGET * INCOME)
+    assert unallocated == 0
+    assert sum(allocation.values()) == pytest.approx(INCOME)
+
+    allocation, _ = _allocate_one(draft, savings_target=0.50)
+    assert allocation["Savings"] == pytest.approx(0.20 * INCOME)
+
+
+def test_full_category_set_sums_to_one_within_caps():
+    cats = COLUMNS[2:]
+    ages = np.array([22.0, 40.0, 65.0])
+    shares = np.random.default_rng(1).uniform(0.0, 0.3, (len(ages), len(cats)))
+    floors, caps = category_limits(ages, cats)
+    flex, topup, critical = category_masks(cats)
+    sav = cats.index("Savings")
+    apply_savings_target(shares, caps, sav)
+    out, left = project(shares, floors, caps, flex, topup, critical, savings=sav)
+    assert np.allclose(out.sum(axis=1), 1.0)
+    assert np.all(out <= caps + 1e-9)
+    assert np.all(left == 0)
+
+
+def test_rebalance_rows_matches_row_by_row_reference():
+    rows = synthetic_rows(2000, seed=3)
+    out, changed = rebalance_rows(rows)
+    for row, new, flag in zip(rows, out, changed):
+        ref, ref_changed = iterative_rebalance_row(row)
+        assert new == ref
+        assert flag == ref_changed
+
+
+def test_two_essentials_do_not_absorb_leftover():
+    names = ["Food", "Transport", "Shopping", "Bills", "Savings"]
+    draft = _draft({"Food": 0.25, "Transport": 0.15, "Shopping": 0.03, "Bills": 0.03, "Savings": 0.10})
+    allocation, unallocated = _allocate_one(draft, age=25)
+    assert list(allocation) == names
+    assert allocation["Food"] == pytest.approx(25000.0)
+    assert allocation["Transport"] == pytest.approx(15000.0)
+    assert allocation["Savings"] == pytest.approx(25000.0)  # young cap
+    assert unallocated == pytest.approx(29000.0)
+
+
+def test_canonical_rules_apply_once_per_category():
+    draft = _draft({"Food": 0.10, "Food Delivery": 0.10, "Savings": 0.17})
+    allocation, unallocated = _allocate_one(draft, age=25)
+    assert allocation["Food"] == pytest.approx(18000.0)  # floor applied once
+    assert allocation["Food Delivery"] == pytest.approx(10000.0)
+    assert sum(allocation.values()) + unallocated == pytest.approx(INCOME)
@@ -0,0 +1,75 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation_store import (  # noqa: E402
+    MemoryConversationStore, SqliteConversationStore, add_turn, cached_grounding,
+    empty_state, history_prompt, is_follow_up, set_grounding,
+)
+
+
+@pytest.mark.parametrize("msg", [
+    "why?", "and next month?", "more", "tell me more", "what about 20%?",
+    "can you explain that", "ok thanks", "is that enough?",
+])
+def test_short_follow_ups_are_allowed(msg):
+    assert is_follow_up(msg)
+
+
+@pytest.mark.parametrize("msg", [
+    "tell me a joke", "what is the capital of France", "how do I bake a cake",
+    "who won the 2022 world cup", "write a poem", "", "?!",
+    "why why why why why why why why why",
+])
+def test_new_topics_are_refused(msg):
+    assert not is_follow_up(msg)
+
+
+def test_add_turn_compacts_old_turns_into_bounded_summary():
+    state = empty_state()
+    for i in range(30):
+        add_turn(state, f"question {i} " + "x" * 300, f"Answer {i}. More detail here.", 1000 + i,
+                 keep_turns=3, summary_max_chars=600)
+
+    assert state["turn_count"] == 30
+    assert [t["user"].split()[1] for t in state["turns"]] == ["27", "28", "29"]
+    assert len(state["summary"]) <= 600
+    lines = state["summary"].splitlines()
+    assert "question 26" in lines[-1] and "Answer 26." in lines[-1]
+    assert "More detail" not in state["summary"]  # only the first sentence is kept
+    assert "question 0 " not in state["summary"]  # oldest lines dropped
+
+    prompt = history_prompt(state)
+    assert prompt.startswith("Conversation so far:")
+    assert "Answer 29. More detail here." in prompt
+    assert history_prompt(empty_state()) == ""
+
+
+def test_grounding_cache_expires():
+    state = set_grounding(empty_state(), {"age": 30})
+    assert cached_grounding(state, ttl=60) == {"age": 30}
+    state["grounding_at"] -= 120
+    assert cached_grounding(state, ttl=60) is None
+
+
+@pytest.mark.parametrize("make_store", [
+    lambda tmp_path: MemoryConversationStore(ttl=60),
+    lambda tmp_path: SqliteConversationStore(str(tmp_path / "conversations.sqlite3"), ttl=60),
+])
+def test_stores_round_trip_and_expire(tmp_path, make_store):
+    store = make_store(tmp_path)
+    state = add_turn(empty_state(), "how do I save?", "Save 20%.", 500)
+    store.save("u1:c1", state)
+
+    assert store.get("u1:c1")["turns"][0]["assistant"] == "Save 20%."
+    assert store.get("u1:c2")["turn_count"] == 0
+
+    store.clear("u1:c1")
+    assert store.get("u1:c1")["turn_count"] == 0
+
+    state["updated_at"] -= 120
+    store.save("u1:c3", state)
+    assert store.get("u1:c3")["turn_count"] == 0
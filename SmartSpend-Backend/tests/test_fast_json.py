@@ -0,0 +1,74 @@
+import gzip
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from flask import Flask, jsonify
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fast_json  # noqa: E402
+from fast_json import negotiate_encoding  # noqa: E402
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("GZIP;q=0.5", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=oops", None),
+    ("*", "gzip"),
+    ("*;q=0, deflate", None),
+    ("deflate, gzip;q=0.1", "gzip"),
+])
+def test_negotiate_encoding_gzip(monkeypatch, header, expected):
+    monkeypatch.setattr(fast_json, "brotli", None)
+    assert negotiate_encoding(header) == expected
+
+
+def test_negotiate_encoding_prefers_higher_q(monkeypatch):
+    monkeypatch.setattr(fast_json, "brotli", object())
+    assert negotiate_encoding("gzip, br") == "br"
+    assert negotiate_encoding("gzip;q=1, br;q=0.5") == "gzip"
+    assert negotiate_encoding("br;q=0, gzip;q=0.2") == "gzip"
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    fast_json.init_app(app)
+
+    @app.route("/big")
+    def big():
+        return jsonify({"rows": [{"n": i, "label": "x" * 20} for i in range(200)]})
+
+    @app.route("/small")
+    def small():
+        return jsonify({"ok": True})
+
+    return app
+
+
+def test_large_responses_are_compressed(app):
+    client = app.test_client()
+    resp = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    assert gzip.decompress(resp.data).startswith(b'{"rows"')
+
+    assert "Content-Encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "Content-Encoding" not in client.get("/big").headers
+
+
+@pytest.mark.skipif(fast_json.orjson is None, reason="orjson not installed")
+def test_orjson_and_fallback_agree_on_dates_and_nan(app):
+    payload = {"when": datetime(2025, 1, 2, 3, 4, 5), "nan": float("nan"), "inf": [float("inf")]}
+    with app.app_context():
+        fast = app.json.dumps(payload)
+        # An int beyond 64 bits makes orjson give up and the stdlib path take over
+        slow = app.json.dumps({**payload, "big": 2 ** 70})
+    assert fast == '{"when":"Thu, 02 Jan 2025 03:04:05 GMT","nan":null,"inf":[null]}'
+    assert slow == fast[:-1] + ',"big":1180591620717411303424}'
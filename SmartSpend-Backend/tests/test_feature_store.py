@@ -0,0 +1,134 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feature_store import FeatureStore, model_features  # noqa: E402
+
+USER = {"id": "u1", "age": 30, "monthly_income": 120000, "gender": "Female",
+        "employment": "Employed", "dependents": 2}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FeatureStore(str(tmp_path / "features.sqlite3"))
+    store.apply_change("users", "INSERT", USER)
+    store.apply_change("categories", "INSERT", {"id": 1, "name": "Food"})
+    store.apply_change("categories", "INSERT", {"id": 2, "name": "Transport"})
+    return store
+
+
+def _spend(store, user_id="u1"):
+    return {r["name"]: r["amount"] for r in store.get_user(user_id)["spend"]}
+
+
+def test_insert_and_update_moves_expense_between_categories(store):
+    expense = {"id": 10, "user_id": "u1", "category_id": 1, "amount": 500}
+    store.apply_change("expenses", "INSERT", expense)
+    store.apply_change("expenses", "INSERT", {"id": 11, "user_id": "u1", "category_id": 1, "amount": 250})
+    assert _spend(store) == {"Food": 750.0}
+
+    moved = {**expense, "category_id": 2, "amount": 800}
+    store.apply_change("expenses", "UPDATE", moved, expense)
+    assert _spend(store) == {"Food": 250.0, "Transport": 800.0}
+
+
+def test_delete_drops_emptied_rows(store):
+    expense = {"id": 10, "user_id": "u1", "category_id": 1, "amount": 500}
+    income = {"id": 20, "user_id": "u1", "source": "Freelance", "amount": 9000}
+    store.apply_change("expenses", "INSERT", expense)
+    store.apply_change("income", "INSERT", income)
+
+    store.apply_change("expenses", "DELETE", None, expense)
+    store.apply_change("income", "DELETE", None, income)
+    user = store.get_user("u1")
+    assert user["spend"] == []
+    assert user["income"] == []
+
+
+def test_user_delete_removes_everything(store):
+    store.apply_change("expenses", "INSERT", {"id": 10, "user_id": "u1", "category_id": 1, "amount": 500})
+    store.apply_change("income", "INSERT", {"id": 20, "user_id": "u1", "source": "Freelance", "amount": 9000})
+    store.apply_change("users", "DELETE", None, {"id": "u1"})
+    assert store.get_user("u1") is None
+    users, expenses = store.training_frames()
+    assert users.empty and expenses.empty
+
+
+def test_unknown_table_is_ignored(store):
+    assert store.apply_change("accounts", "INSERT", {"id": 1}) is False
+
+
+def test_missing_profile_values_stay_missing(store):
+    store.apply_change("users", "INSERT", {"id": "u2", "age": None, "monthly_income": None,
+                                           "gender": None, "employment": "retired"})
+    profile = store.get_user("u2")["profile"]
+    assert profile["age"] is None and profile["monthly_income"] is None
+
+    features = model_features(profile)
+    assert features["Age"] is None and features["Income"] is None
+    assert features["Gender"] is None and features["Employment"] is None
+
+    users, _ = store.training_frames()
+    row = users.set_index("id").loc["u2"]
+    assert pd.isna(row["age"]) and pd.isna(row["monthly_income"])
+
+
+def test_model_features_encode_known_profile(store):
+    assert model_features(store.get_user("u1")["profile"]) == {
+        "Age": 30.0, "Income": 120000.0, "Gender": 1, "Employment": 1, "Dependents": 2,
+    }
+
+
+class FakeQuery:
+    def __init__(self, rows, log, table):
+        self.rows, self.log, self.table = rows, log, table
+
+    def select(self, *args):
+        return self
+
+    def in_(self, column, values):
+        self.rows = [r for r in self.rows if str(r.get(column)) in values]
+        return self
+
+    def order(self, *args):
+        return self
+
+    def range(self, start, end):
+        self.rows = self.rows[start:end + 1]
+        return self
+
+    def execute(self):
+        self.log.append(self.table)
+        return type("Response", (), {"data": self.rows})()
+
+
+class FakeClient:
+    def __init__(self, tables):
+        self.tables, self.log = tables, []
+
+    def table(self, name):
+        return FakeQuery(list(self.tables[name]), self.log, name)
+
+
+def test_load_users_backfills_a_batch_with_one_query_per_table(tmp_path):
+    store = FeatureStore(str(tmp_path / "features.sqlite3"))
+    ids = [f"u{i}" for i in range(30)]
+    client = FakeClient({
+        "users": [{"id": uid, "age": 30, "monthly_income": 50000} for uid in ids],
+        "income": [],
+        "expenses": [{"id": i, "user_id": uid, "category_id": 1, "amount": 100} for i, uid in enumerate(ids)],
+        "categories": [{"id": 1, "user_id": uid, "name": "Food"} for uid in ids[:1]],
+    })
+
+    loaded = store.load_users(client, ids + ["missing"])
+    assert sorted(client.log) == ["categories", "expenses", "income", "users"]
+    assert loaded["missing"] is None
+    assert all(loaded[uid]["spend"][0]["amount"] == 100.0 for uid in ids)
+
+    client.log.clear()
+    store.load_users(client, ids)
+    assert client.log == []  # fresh entries are served from the store
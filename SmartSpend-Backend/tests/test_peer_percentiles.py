@@ -0,0 +1,109 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import peer_percentiles  # noqa: E402
+from peer_percentiles import (  # noqa: E402
+    build_sketches, interpolate_rows, load_sketches, save_sketches,
+)
+from supabase_pages import fetch_all  # noqa: E402
+
+
+class FakeQuery:
+    """Just enough of the PostgREST builder: filters are ignored, range pages rows."""
+
+    max_rows = 1000
+
+    def __init__(self, rows, log):
+        self.rows = rows
+        self.log = log
+        self.bounds = None
+
+    def select(self, *args):
+        return self
+
+    def eq(self, *args):
+        return self
+
+    def or_(self, *args):
+        return self
+
+    def order(self, *args):
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end)
+        return self
+
+    def execute(self):
+        self.log.append(self.bounds)
+        rows = self.rows
+        if self.bounds is not None:
+            rows = rows[self.bounds[0]:self.bounds[1] + 1]
+        return type("Response", (), {"data": rows[:self.max_rows]})()
+
+
+class FakeClient:
+    def __init__(self, tables):
+        self.tables = tables
+        self.log = []
+
+    def table(self, name):
+        return FakeQuery(self.tables[name], self.log)
+
+
+def test_fetch_all_pages_past_max_rows():
+    client = FakeClient({"expenses": [{"id": i} for i in range(2500)]})
+    rows = fetch_all(lambda: client.table("expenses").select("*").order("id"), page_size=1000)
+    assert [r["id"] for r in rows] == list(range(2500))
+    assert client.log == [(0, 999), (1000, 1999), (2000, 2999)]
+
+
+def test_sketches_use_every_page():
+    users = [{"id": f"u{i}", "age": 25, "monthly_income": 80000} for i in range(1500)]
+    expenses = [
+        {"id": i, "user_id": f"u{i}", "amount": 100 + i, "category_id": 1, "categories": {"name": "Food"}}
+        for i in range(1500)
+    ]
+    df = peer_percentiles.fetch_user_category_spend(FakeClient({"users": users, "expenses": expenses}))
+    assert len(df) == 1500
+
+
+def test_interpolate_rows_edges():
+    grid = np.array([[10.0, 20.0, 30.0], [5.0, 5.0, 5.0]])
+    below = interpolate_rows(grid, np.array([0.0, 1.0]))
+    above = interpolate_rows(grid, np.array([99.0, 9.0]))
+    inside = interpolate_rows(grid, np.array([15.0, 5.0]))
+    assert below.tolist() == [0.0, 0.0]
+    assert above.tolist() == [100.0, 100.0]
+    assert inside[0] == pytest.approx(25.0)
+    assert inside[1] == pytest.approx(100.0)
+    assert interpolate_rows(grid[:1], np.array([20.0]))[0] == pytest.approx(50.0)
+
+
+def test_sketch_file_round_trip(tmp_path):
+    import pandas as pd
+
+    rnd = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "id": [f"u{i}" for i in range(40)],
+        "Age": rnd.integers(20, 70, 40),
+        "Income": rnd.integers(20000, 300000, 40),
+        "Food": rnd.uniform(0, 50000, 40),
+        "Transport": rnd.uniform(0, 20000, 40),
+    })
+    sketches = build_sketches(df)
+    path = str(tmp_path / "peers.npz")
+    save_sketches(sketches, path)
+    loaded = load_sketches(path)
+
+    assert sorted(loaded) == sorted(sketches)
+    for key, (cats, grid, counts) in sketches.items():
+        assert loaded[key][0] == cats
+        assert np.array_equal(loaded[key][1], grid)
+        assert np.array_equal(loaded[key][2], counts)
+    assert [f for f in os.listdir(tmp_path) if f.endswith(".tmp.npz")] == []
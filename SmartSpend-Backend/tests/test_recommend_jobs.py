@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import recommend_jobs  # noqa: E402
+from recommend_jobs import JobQueue  # noqa: E402
+
+
+class Recorder:
+    def __init__(self):
+        self.chunks = []
+
+    def __call__(self, items):
+        self.chunks.append(list(items))
+        return [{"value": item * 10} for item in items]
+
+
+@pytest.fixture
+def queue(tmp_path):
+    batch = Recorder()
+    return JobQueue(batch, path=str(tmp_path / "jobs.sqlite3"), chunk_size=2, lease_seconds=60), batch
+
+
+def _expire_lease(queue, job_id):
+    queue._conn().execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() - 1, job_id))
+
+
+def test_job_runs_in_chunks(queue):
+    q, batch = queue
+    job_id = q.submit([1, 2, 3, 4, 5])
+    job = q._claim("w1")
+    q._run(job[0], job[1], "w1", job[2], job[3])
+
+    status = q.status(job_id)
+    assert status["status"] == "done"
+    assert status["processed"] == 5 and status["eta_seconds"] is None
+    assert batch.chunks == [[1, 2], [3, 4], [5]]
+    assert [r["value"] for r in q.results(job_id)] == [10, 20, 30, 40, 50]
+
+
+def test_expired_lease_requeues_and_resumes(queue):
+    q, batch = queue
+    job_id = q.submit([1, 2, 3, 4, 5])
+    q._claim("dead")
+    # The dead worker got through its first chunk before it stopped
+    conn = q._conn()
+    conn.execute("UPDATE jobs SET processed = 2 WHERE id = ?", (job_id,))
+    conn.executemany("INSERT INTO job_results (job_id, idx, result) VALUES (?, ?, ?)",
+                     [(job_id, 0, '{"value": 10}'), (job_id, 1, '{"value": 20}')])
+
+    assert q._claim("live") is None  # lease still held
+    _expire_lease(q, job_id)
+    job = q._claim("live")
+    assert job[0] == job_id and job[2] == 2
+
+    q._run(job[0], job[1], "live", job[2], job[3])
+    assert batch.chunks == [[3, 4], [5]]
+    assert [r["value"] for r in q.results(job_id)] == [10, 20, 30, 40, 50]
+
+
+def test_worker_that_lost_its_lease_stops_writing(queue):
+    q, batch = queue
+    job_id = q.submit([1, 2, 3])
+    stale = q._claim("dead")
+    _expire_lease(q, job_id)
+    q._claim("live")
+
+    q._run(stale[0], stale[1], "dead", stale[2], stale[3])
+    status = q.status(job_id)
+    assert status["status"] == "running" and status["processed"] == 0
+    assert q.results(job_id) == []
+
+
+def test_sweep_removes_only_expired_finished_jobs(queue):
+    q, _ = queue
+    old, recent, queued = q.submit([1]), q.submit([2]), q.submit([3])
+    for job_id in (old, recent):
+        job = q._claim("w1")
+        q._run(job[0], job[1], "w1", job[2], job[3])
+    q._conn().execute("UPDATE jobs SET finished_at = ? WHERE id = ?",
+                      (time.time() - q.retention_seconds - 10, old))
+
+    assert q.sweep() == 1
+    assert q.status(old) is None and q.results(old) == []
+    assert q.status(recent)["status"] == "done"
+    assert q.status(queued)["status"] == "queued"
+
+
+def test_webhook_allowlist(monkeypatch):
+    monkeypatch.setattr(recommend_jobs, "WEBHOOK_HOSTS", {"hooks.example.com"})
+    assert recommend_jobs.webhook_allowed("https://hooks.example.com/done")
+    assert not recommend_jobs.webhook_allowed("http://hooks.example.com/done")
+    assert not recommend_jobs.webhook_allowed("https://169.254.169.254/latest")
+    assert not recommend_jobs.webhook_allowed("not a url")
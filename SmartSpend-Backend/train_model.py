@@ -13,8 +13,15 @@ CANONICAL = [
 # Load your exported CSV
 df = pd.read_csv("real_training_data.csv")
 
-# Inputs/features (what app.py already supports)
-FEATURES = ["Age", "Income"]
+# Inputs/features: Age/Income always, plus the richer profile features when the
+# export has them (app.py builds the same columns from the feature store)
+OPTIONAL_FEATURES = ["Gender", "Employment", "Dependents"]
+FEATURES = ["Age", "Income"] + [c for c in OPTIONAL_FEATURES if c in df.columns]
+# Rows missing a feature are dropped rather than trained on as zeros
+missing = df[FEATURES].isna().any(axis=1)
+if missing.any():
+    print(f"⚠️ Dropping {int(missing.sum())} rows with missing {FEATURES}")
+    df = df[~missing].copy()
 X = df[FEATURES].astype(float)
 
 # Ensure all target columns exist; fill missing with 0
@@ -18,7 +18,7 @@ import { Ionicons } from '@expo/vector-icons';
 import { MaterialIcons } from '@expo/vector-icons';
 import Markdown from 'react-native-markdown-display';
 import { useTranslation } from 'react-i18next';
-import { askInvestAssistant } from '../services/chatApi';
+import { askInvestAssistant, newConversationId, resetConversation } from '../services/chatApi';
 import { supabase } from '../services/supabase';
 
 function lkr(n) {
@@ -113,6 +113,7 @@ export default function ChatbotScreen() {
   const langMap = { en: 'English', si: 'Sinhala', ta: 'Tamil' };
 
   const listRef = useRef(null);
+  const conversationId = useRef(newConversationId());
 
   const intro = t('chat.intro', {
     defaultValue:
@@ -204,6 +205,7 @@ export default function ChatbotScreen() {
         messages: payloadMessages,
         targetLang,
         grounding: groundingState,
+        conversationId: conversationId.current,
       });
 
       if (!isActive) return;
@@ -300,6 +302,8 @@ if (
   }
 
   function clearChat() {
+    resetConversation(conversationId.current);
+    conversationId.current = newConversationId();
     setMessages([{ role: 'assistant', content: intro }]);
     setPlan(null);
     setInput('');
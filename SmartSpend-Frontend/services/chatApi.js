@@ -1,10 +1,39 @@
 // SmartSpend-Frontend/services/chatApi.js
+import "react-native-get-random-values";
 import { supabase } from "./supabase";
 
 // 🔗 Always use the hosted Railway backend in production
 const BACKEND_URL = "http://192.168.1.3:5050";
 
-export async function askInvestAssistant({ messages, targetLang, grounding }) {
+// 🧵 Random id for one chat; the backend keeps its memory per conversation id
+export function newConversationId() {
+  const bytes = new Uint8Array(16);
+  crypto.getRandomValues(bytes);
+  return Array.from(bytes, (b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+// 🧹 Forget a conversation on the backend ("New Chat")
+export async function resetConversation(conversationId) {
+  try {
+    const {
+      data: { session },
+    } = await supabase.auth.getSession();
+    if (!session?.user || !conversationId) return;
+
+    await fetch(`${BACKEND_URL}/chatbot/reset`, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        Authorization: `Bearer ${session.access_token}`,
+      },
+      body: JSON.stringify({ user_id: session.user.id, conversation_id: conversationId }),
+    });
+  } catch (err) {
+    console.error("resetConversation error:", err.message || err);
+  }
+}
+
+export async function askInvestAssistant({ messages, targetLang, grounding, conversationId }) {
   try {
     // ✅ Always get logged in user id from Supabase
     const {
@@ -27,6 +56,7 @@ export async function askInvestAssistant({ messages, targetLang, grounding }) {
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
           user_id: user.id,
+          conversation_id: conversationId,
           message: latestMessage,
           grounding,
           targetLang,